@@ -0,0 +1,218 @@
+# Async (ASGI) entry point for the updatedUI.py pipeline.
+# /video streams are async generators fed from the shared frame buffer, so one
+# event loop holds many open streams instead of one OS thread per client.
+# Capture, inference and encoding stay on their own threads.
+#
+# Run with: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+import asyncio
+import contextlib
+
+import anyio.from_thread
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import installed_flask  # noqa: F401  Before updatedUI, see installed_flask.py
+import updatedUI as pipeline
+from events import format_sse
+from h264 import FMP4_MIMETYPE
+from metrics import CONTENT_TYPE, REGISTRY
+from session import parse_settings
+from stream import MJPEG_MIMETYPE
+from upload import MAX_UPLOAD_BYTES, FrameDecoder, UploadTooLarge
+
+
+async def index(request):
+    with pipeline.app.app_context():
+        return HTMLResponse(pipeline.render_index())
+
+
+def _int_param(request, name):
+    value = request.query_params.get(name)
+    return int(value) if value and value.isdigit() else None
+
+
+async def video(request):
+    hub = pipeline.camera_registry.hub(request.path_params.get('camera_id'))
+    if hub is None:
+        raise HTTPException(404)
+    tier = hub.tier(_int_param(request, 'w'), _int_param(request, 'q'))
+    await run_in_threadpool(hub.ensure_started)
+    return StreamingResponse(hub.asubscribe(tier, pipeline.ADAPTIVE_TIERS), media_type=MJPEG_MIMETYPE)
+
+
+async def video_mp4(request):
+    camera_id = request.path_params.get('camera_id', pipeline.camera_registry.default)
+    stream = pipeline.h264_streams.get(camera_id)
+    if stream is None:
+        raise HTTPException(404)
+    await run_in_threadpool(pipeline.camera_registry.hub(camera_id).ensure_started)
+    return StreamingResponse(stream.asubscribe(), media_type=FMP4_MIMETYPE, headers={'Cache-Control': 'no-cache'})
+
+
+async def verification_events(request):
+    session_id = request.path_params['session_id']
+    subscription = pipeline.event_bus.subscribe(session_id, loop=asyncio.get_running_loop())
+
+    async def stream():
+        try:
+            state = pipeline.find_state(session_id)
+            if state is not None:
+                yield format_sse(dict(state, type='state'))
+            while True:
+                events = await subscription.aget(timeout=15)
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            pipeline.event_bus.unsubscribe(session_id, subscription)
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def verification_state(request):
+    state = pipeline.find_state(request.path_params['session_id'])
+    if state is None:
+        raise HTTPException(404)
+    return JSONResponse(state)
+
+
+async def reset_verification(request):
+    session_id = request.path_params['session_id']
+    if not pipeline.known_session(session_id):
+        raise HTTPException(404)
+    pipeline.send_command(session_id, reset=True)
+    return JSONResponse({'status': 'queued'}, status_code=202)
+
+
+async def verification_config(request):
+    session_id = request.path_params['session_id']
+    if request.method == 'POST':
+        if not pipeline.known_session(session_id):
+            raise HTTPException(404)
+        try:
+            settings = parse_settings(await request.json())
+        except ValueError as e:  # Includes a body that is not valid JSON
+            raise HTTPException(400, str(e))
+        pipeline.send_command(session_id, settings=settings)
+        return JSONResponse({'status': 'queued', 'settings': settings}, status_code=202)
+    state = pipeline.find_state(session_id)
+    if state is None:
+        raise HTTPException(404)
+    return JSONResponse(state['settings'])
+
+
+def _decoder(session):
+    if session.decoder is None:
+        session.decoder = FrameDecoder(pipeline.UPLOAD_MAX_WIDTH)
+    return session.decoder
+
+
+# Decode and verify off the event loop: both are CPU-bound. The lock keeps
+# overlapping requests for one session from interleaving its state
+def _verify(session, data):
+    with session.lock:
+        img = _decoder(session).decode(data)
+        return None if img is None else pipeline.verify_frame(img, session)
+
+
+# Body chunks of a request, pulled from the event loop by a threadpool thread
+def _body_chunks(request):
+    stream = request.stream()
+    while True:
+        try:
+            yield anyio.from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            return
+
+
+# Like _verify, but the body is read into the session's reused decoder buffer
+# under the same lock, as the Flask route reads request.stream
+def _verify_upload(session, request, length):
+    with session.lock:
+        decoder = _decoder(session)
+        img = decoder.decode(decoder.read_chunks(_body_chunks(request), length))
+        return None if img is None else pipeline.verify_frame(img, session)
+
+
+async def verify_uploaded_frame(request):
+    length = request.headers.get('content-length', '')
+    length = int(length) if length.isdigit() else 0
+    if length > MAX_UPLOAD_BYTES:
+        raise HTTPException(413)
+    session = pipeline.sessions.get(request.path_params['session_id'])
+    try:
+        result = await run_in_threadpool(_verify_upload, session, request, length)
+    except UploadTooLarge:
+        raise HTTPException(413)
+    if result is None:
+        raise HTTPException(400)
+    return JSONResponse(result)
+
+
+# One WebSocket per device: binary JPEG messages in, one JSON verdict out per frame
+async def verify_websocket(websocket):
+    session_id = websocket.path_params['session_id']
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            if len(data) > MAX_UPLOAD_BYTES:
+                await websocket.send_json({'error': 'frame too large'})
+                continue
+            session = pipeline.sessions.get(session_id)
+            result = await run_in_threadpool(_verify, session, data)
+            await websocket.send_json(result if result is not None else {'error': 'invalid image'})
+    except WebSocketDisconnect:
+        pass
+
+
+async def inference_stats(request):
+    return JSONResponse(pipeline.scheduler.stats())
+
+
+async def healthz(request):
+    return JSONResponse({'status': 'ok'})
+
+
+# 503 until the model is loaded and warmed up, so no traffic reaches a cold process
+async def readyz(request):
+    if pipeline.model.ready:
+        return JSONResponse({'status': 'ready'})
+    if pipeline.model.error is not None:
+        return JSONResponse({'status': 'error', 'error': str(pipeline.model.error)}, status_code=503)
+    return JSONResponse({'status': 'loading'}, status_code=503)
+
+
+async def metrics(request):
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    pipeline.model.start()  # Loads and warms up in the background; see /readyz
+    yield
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/', index),
+    Route('/video', video),
+    Route('/video/{camera_id}', video),
+    Route('/video.mp4', video_mp4),
+    Route('/video.mp4/{camera_id}', video_mp4),
+    Route('/events/{session_id}', verification_events),
+    Route('/verification/{session_id}', verification_state),
+    Route('/verification/{session_id}/reset', reset_verification, methods=['POST']),
+    Route('/verification/{session_id}/config', verification_config, methods=['GET', 'POST']),
+    Route('/verify/{session_id}/frame', verify_uploaded_frame, methods=['POST']),
+    WebSocketRoute('/ws/verify/{session_id}', verify_websocket),
+    Route('/inference/stats', inference_stats),
+    Route('/metrics', metrics),
+    Route('/healthz', healthz),
+    Route('/readyz', readyz),
+])
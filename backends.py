@@ -0,0 +1,220 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'openvino')
+
+
+# Minimal stand-in for ultralytics' Boxes: xyxy (N, 4), conf (N,) and cls (N,)
+# arrays, iterating yields one Boxes per detection so box.xyxy[0] keeps working.
+class Boxes:
+    __slots__ = ('xyxy', 'conf', 'cls')
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __iter__(self):
+        for i in range(len(self.conf)):
+            yield Boxes(self.xyxy[i:i + 1], self.conf[i:i + 1], self.cls[i:i + 1])
+
+
+class Results:
+    __slots__ = ('boxes', 'orig_shape')
+
+    def __init__(self, boxes, orig_shape):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+
+
+# Resize with unchanged aspect ratio and pad to a square imgsz x imgsz input
+def letterbox(img, imgsz):
+    h, w = img.shape[:2]
+    gain = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * gain)), int(round(w * gain))
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    out = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return out, gain, (left, top)
+
+
+def preprocess(imgs, imgsz):
+    blob = np.empty((len(imgs), 3, imgsz, imgsz), dtype=np.float32)
+    metas = []
+    for i, img in enumerate(imgs):
+        padded, gain, pad = letterbox(img, imgsz)
+        blob[i] = padded[:, :, ::-1].transpose(2, 0, 1)
+        metas.append((gain, pad, img.shape[:2]))
+    blob /= 255.0
+    return blob, metas
+
+
+# Decode one raw YOLOv8 head output (4 + num_classes, num_anchors) into Results
+def decode(pred, meta, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+    gain, (left, top), (h, w) = meta
+    scores = pred[4:]
+    cls = scores.argmax(0)
+    conf = scores[cls, np.arange(scores.shape[1])]
+    keep = conf > conf_threshold
+    if not keep.any():
+        empty = np.zeros((0,), dtype=np.float32)
+        return Results(Boxes(np.zeros((0, 4), dtype=np.float32), empty, empty), (h, w))
+
+    cx, cy, bw, bh = pred[:4, keep]
+    conf, cls = conf[keep], cls[keep]
+    xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - left) / gain).clip(0, w)
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - top) / gain).clip(0, h)
+
+    # Class-aware NMS: offset boxes per class so different classes never overlap
+    offset = cls[:, None] * float(max(h, w) + 1)
+    nms_boxes = xyxy + offset
+    nms_boxes[:, 2:] -= nms_boxes[:, :2]
+    idx = np.asarray(cv2.dnn.NMSBoxes(nms_boxes.tolist(), conf.tolist(), conf_threshold, iou_threshold),
+                     dtype=np.int64).reshape(-1)[:max_det]
+    return Results(Boxes(xyxy[idx].astype(np.float32), conf[idx].astype(np.float32),
+                         cls[idx].astype(np.float32)), (h, w))
+
+
+# Shared call interface: model(img or [imgs], verbose=False) -> [Results]
+class ExportedModel:
+    def __init__(self, imgsz=640, conf=0.25, iou=0.45):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def run(self, blob):
+        raise NotImplementedError
+
+    def __call__(self, imgs, verbose=False, stream=False, **kwargs):
+        if not isinstance(imgs, (list, tuple)):
+            imgs = [imgs]
+        blob, metas = preprocess(imgs, self.imgsz)
+        preds = self.run(blob)
+        return [decode(pred, meta, self.conf, self.iou) for pred, meta in zip(preds, metas)]
+
+
+class OnnxModel(ExportedModel):
+    def __init__(self, path, providers=None, **kwargs):
+        super().__init__(**kwargs)
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(path, providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoModel(ExportedModel):
+    def __init__(self, path, device='CPU', **kwargs):
+        super().__init__(**kwargs)
+        import openvino as ov
+
+        core = ov.Core()
+        xml = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xml'))
+        self.compiled = core.compile_model(core.read_model(xml), device)
+        self.output = self.compiled.output(0)
+
+    def run(self, blob):
+        return self.compiled([blob])[self.output]
+
+
+def _is_fresh(artifact, weights):
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(weights)
+
+
+# Export the .pt weights once and cache the artifact next to them
+def export_model(weights, backend, imgsz=640):
+    from ultralytics import YOLO
+
+    stem = os.path.splitext(weights)[0]
+    if backend == 'onnx':
+        artifact = stem + '.onnx'
+        if not _is_fresh(artifact, weights):
+            YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        return artifact
+    if backend == 'onnx-int8':
+        artifact = stem + '.int8.onnx'
+        if not _is_fresh(artifact, weights):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(export_model(weights, 'onnx', imgsz), artifact, weight_type=QuantType.QUInt8)
+        return artifact
+    if backend == 'openvino':
+        artifact = stem + '_openvino_model'
+        if not _is_fresh(artifact, weights):
+            YOLO(weights).export(format='openvino', imgsz=imgsz, dynamic=True)
+        return artifact
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+# Load the model for the requested backend; exported backends are built on first use
+def load_model(weights, backend='torch', imgsz=640):
+    if backend == 'torch':
+        from ultralytics import YOLO
+
+        return YOLO(weights)
+    artifact = export_model(weights, backend, imgsz)
+    if backend == 'openvino':
+        return OpenVinoModel(artifact, imgsz=imgsz)
+    return OnnxModel(artifact, imgsz=imgsz)
+
+
+# Model that is loaded and warmed up on a background thread, so importing an
+# app is cheap and the first request does not pay for initialization. start()
+# begins loading (idempotent); calls block until the model is ready.
+class LazyModel:
+    def __init__(self, weights, backend='torch', imgsz=640, warmup=1, warmup_shape=(640, 360, 3)):
+        self.weights = weights
+        self.backend = backend
+        self.imgsz = imgsz
+        self.warmup = warmup
+        self.warmup_shape = warmup_shape
+        self.error = None
+        self._model = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            model = load_model(self.weights, self.backend, self.imgsz)
+            dummy = np.zeros(self.warmup_shape, dtype=np.uint8)
+            for _ in range(self.warmup):
+                model([dummy], verbose=False)
+            self._model = model
+        except Exception as e:
+            self.error = e
+        finally:
+            self._loaded.set()
+
+    # True once the model is loaded and warmed up
+    @property
+    def ready(self):
+        return self._loaded.is_set() and self.error is None
+
+    def wait(self, timeout=None):
+        self.start()
+        if not self._loaded.wait(timeout):
+            return False
+        if self.error is not None:
+            raise RuntimeError(f"Loading {self.weights} failed") from self.error
+        return True
+
+    def __call__(self, *args, **kwargs):
+        self.wait()
+        return self._model(*args, **kwargs)
@@ -0,0 +1,99 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import INFERENCE_BATCH_SIZE, INFERENCE_SECONDS
+
+
+# Collects frames from several streams and runs them through the model as one
+# batched call. A batch is closed when it reaches max_batch_size, when every
+# recently active stream has a frame in it, or after max_wait seconds.
+class InferenceScheduler:
+    def __init__(self, model, max_batch_size=8, max_wait=0.005, active_window=1.0, **predict_kwargs):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.active_window = active_window
+        self.predict_kwargs = dict(verbose=False, **predict_kwargs)
+        self._queue = queue.Queue()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._batches = collections.deque(maxlen=256)  # (size, latency, finished_at)
+        self._total_batches = 0
+        self._total_frames = 0
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, img, stream_id=None):
+        future = Future()
+        now = time.time()
+        with self._lock:
+            self._active[stream_id] = now
+        self._queue.put((img, future, now))
+        return future
+
+    # Blocking helper: returns the Results of one frame
+    def infer(self, img, stream_id=None):
+        return self.submit(img, stream_id).result()
+
+    def _active_streams(self, now):
+        with self._lock:
+            stale = [sid for sid, t in self._active.items() if now - t > self.active_window]
+            for sid in stale:
+                del self._active[sid]
+            return len(self._active)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        expected = min(self.max_batch_size, self._active_streams(time.time()))
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                if len(batch) >= expected:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.time()
+            try:
+                results = self.model([img for img, _, _ in batch], **self.predict_kwargs)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.time()
+            INFERENCE_SECONDS.observe(finished - start)
+            INFERENCE_BATCH_SIZE.observe(len(batch))
+            for (_, future, _), r in zip(batch, results):
+                future.set_result(r)
+            with self._lock:
+                self._batches.append((len(batch), finished - start, finished))
+                self._total_batches += 1
+                self._total_frames += len(batch)
+
+    # Latency/throughput over the most recent batches
+    def stats(self):
+        with self._lock:
+            batches = list(self._batches)
+            total_batches, total_frames = self._total_batches, self._total_frames
+        if not batches:
+            return {'batches': 0, 'frames': 0}
+        frames = sum(size for size, _, _ in batches)
+        busy = sum(latency for _, latency, _ in batches)
+        return {
+            'batches': total_batches,
+            'frames': total_frames,
+            'mean_batch_size': frames / len(batches),
+            'mean_batch_latency_ms': busy / len(batches) * 1000,
+            'last_batch_latency_ms': batches[-1][1] * 1000,
+            'frames_per_second': frames / busy if busy else 0.0,
+            'queued': self._queue.qsize(),
+        }
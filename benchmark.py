@@ -0,0 +1,277 @@
+# Reproducible end-to-end benchmark for the stream pipeline.
+#
+# Replays a recorded video (or synthetic frames) in place of cv2.VideoCapture,
+# drives an app's generate_frames() with N simulated /video clients and reports
+# per-stage latency (capture, inference, drawing, encode, yield), end-to-end
+# latency percentiles, frames/sec per client, CPU and RSS as JSON.
+#
+# Examples:
+#   python benchmark.py --app updatedUI --video attempt.mp4 --clients 4 --duration 30
+#   python benchmark.py --app flask --synthetic --model stub --output bench_flask.json
+import argparse
+import importlib.util
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import backends
+import stream
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APPS = {'flask': 'flask.py', 'updatedUI': 'updatedUI.py'}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+    }
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+
+# Stand-in for cv2.VideoCapture: replays a video file in a loop, or synthetic
+# frames, paced to `fps`. Remembers when each frame left the capture stage.
+class ReplayCapture:
+    def __init__(self, timer, video=None, fps=30, width=360, height=640, max_frames=300):
+        self.timer = timer
+        self.interval = 1 / fps if fps else 0
+        self.capture_times = {}
+        self._next = time.perf_counter()
+        self._index = 0
+        if video:
+            cap = cv2.VideoCapture(video)
+            self.frames = []
+            while len(self.frames) < max_frames:
+                success, img = cap.read()
+                if not success:
+                    break
+                self.frames.append(img)
+            cap.release()
+            if not self.frames:
+                raise SystemExit(f"Could not read frames from {video}")
+        else:
+            rng = np.random.default_rng(0)
+            base = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+            self.frames = [np.roll(base, i * 4, axis=1) for i in range(30)]
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        if self.interval:
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next = max(self._next + self.interval, time.perf_counter() - self.interval)
+        start = time.perf_counter()
+        img = self.frames[self._index % len(self.frames)].copy()
+        self._index += 1
+        now = time.perf_counter()
+        self.timer.record('capture', now - start)
+        self.capture_times[id(img)] = now
+        if len(self.capture_times) > 1000:
+            for key in list(self.capture_times)[:500]:
+                del self.capture_times[key]
+        return True, img
+
+
+# Model stand-in with a fixed latency, for measuring everything but the network
+class StubModel:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def __call__(self, imgs, verbose=False, **kwargs):
+        if not isinstance(imgs, (list, tuple)):
+            imgs = [imgs]
+        time.sleep(self.latency)
+        results = []
+        for img in imgs:
+            h, w = img.shape[:2]
+            xyxy = np.array([[w * 0.25, h * 0.25, w * 0.75, h * 0.75]], dtype=np.float32)
+            results.append(backends.Results(backends.Boxes(xyxy, np.array([0.9], dtype=np.float32),
+                                                           np.array([1], dtype=np.float32)), (h, w)))
+        return results
+
+
+# The repo's flask.py shadows the Flask package when the repo dir is on
+# sys.path, so import the real package first (installed_flask) and load apps
+# under other names.
+def load_app(name):
+    import installed_flask  # noqa: F401
+    spec = importlib.util.spec_from_file_location(f'bench_{name}', os.path.join(ROOT, APPS[name]))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(args):
+    timer = StageTimer()
+    capture = ReplayCapture(timer, None if args.synthetic else args.video, args.fps)
+    cv2.VideoCapture = lambda *a, **k: capture
+
+    load_model = backends.load_model
+    if args.model == 'stub':
+        backends.load_model = lambda *a, **k: StubModel(args.stub_latency)
+    elif args.backend:
+        backends.load_model = lambda weights, backend='torch', *a, **k: load_model(weights, args.backend, *a, **k)
+    app = load_app(args.app)
+
+    # Stage hooks; annotate_frame looks these names up at call time
+    app.detect_faces = timer.wrap('inference', app.detect_faces)
+    app.draw_overlay = timer.wrap('drawing', app.draw_overlay)
+    app.draw_reset_countdown = timer.wrap('drawing', app.draw_reset_countdown)
+    encoder = app.encoder_pool.encoder
+    encoder.encode = timer.wrap('encode', encoder.encode)
+
+    published = {}
+    make_part = stream.mjpeg_part
+
+    def timed_part(jpeg):
+        part = make_part(jpeg)
+        published[id(part)] = (time.perf_counter(), capture_times_for(jpeg))
+        if len(published) > 1000:
+            for key in list(published)[:500]:
+                del published[key]
+        return part
+
+    encoded_from = {}
+    encode = encoder.encode
+
+    def encode_with_origin(img, *a, **k):
+        data = encode(img, *a, **k)
+        if data is not None:
+            encoded_from[id(data)] = capture.capture_times.get(id(img))
+        return data
+
+    def capture_times_for(jpeg):
+        return encoded_from.pop(id(jpeg), None)
+
+    encoder.encode = encode_with_origin
+    stream.mjpeg_part = timed_part
+
+    received = [[] for _ in range(args.clients)]
+    end_to_end = []
+    stop = threading.Event()
+
+    def client(i):
+        frames = app.generate_frames()
+        for frame in frames:
+            now = time.perf_counter()
+            origin = published.get(id(frame))
+            if origin is not None:
+                timer.record('yield', now - origin[0])
+                if origin[1] is not None:
+                    end_to_end.append(now - origin[1])
+            received[i].append(now)
+            if stop.is_set():
+                frames.close()
+                return
+
+    clients = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.clients)]
+    for t in clients:
+        t.start()
+    time.sleep(args.warmup)
+    for samples in timer.samples.values():
+        samples.clear()
+    end_to_end.clear()
+    for r in received:
+        r.clear()
+    cpu_start, wall_start = os.times(), time.perf_counter()
+    time.sleep(args.duration)
+    stop.set()
+    cpu_end, wall = os.times(), time.perf_counter() - wall_start
+    for t in clients:
+        t.join(timeout=2)
+
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    report = {
+        'app': args.app,
+        'source': 'synthetic' if args.synthetic else args.video,
+        'model': args.model if args.model == 'stub' else (args.backend or 'app default'),
+        'clients': args.clients,
+        'duration_s': wall,
+        'stages': {stage: summarize(samples) for stage, samples in timer.samples.items()},
+        'end_to_end': summarize(end_to_end),
+        'fps_per_client': [len(r) / wall for r in received],
+        'pipeline_fps': len(timer.samples.get('encode', [])) / wall,
+        'encoder_dropped': app.encoder_pool.dropped,
+        'cpu_cores_used': cpu / wall,
+        'rss_mb': rss_mb(),
+    }
+    return report
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        except ImportError:
+            return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stream pipeline with simulated clients")
+    parser.add_argument('--app', choices=sorted(APPS), default='updatedUI')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help="recorded video replayed in place of the camera")
+    source.add_argument('--synthetic', action='store_true', help="use generated frames")
+    parser.add_argument('--fps', type=float, default=30, help="camera frame rate to simulate (0 = unpaced)")
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--model', choices=['real', 'stub'], default='real')
+    parser.add_argument('--backend', choices=backends.BACKENDS, help="override the app's MODEL_BACKEND")
+    parser.add_argument('--stub-latency', type=float, default=0.03)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import math
+import time
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+# Decides on which frames the detector runs and carries the last boxes forward
+# in between. Detections are (x1, y1, x2, y2, conf, cls) tuples.
+#
+# every_n fixes the cadence (1 = every frame). When frame_budget (seconds of
+# inference allowed per frame) is set, every_n adapts to the measured latency.
+# Skipped frames get the last boxes moved along their measured velocity;
+# boxes older than max_age are dropped.
+class CadenceTracker:
+    __slots__ = ('every_n', 'frame_budget', 'max_every_n', 'max_extrapolation', 'max_age', '_countdown',
+                 '_latency', '_detections', '_velocities', '_detected_at')
+
+    def __init__(self, every_n=1, frame_budget=None, max_every_n=15, max_extrapolation=0.5, max_age=1.0):
+        self.every_n = every_n
+        self.frame_budget = frame_budget
+        self.max_every_n = max_every_n
+        self.max_extrapolation = max_extrapolation
+        self.max_age = max_age
+        self._countdown = 0
+        self._latency = None
+        self._detections = []
+        self._velocities = []
+        self._detected_at = None
+
+    # Call once per frame; True when the detector should run on this frame
+    def should_infer(self):
+        self._countdown -= 1
+        if self._countdown < 0:
+            self._countdown = self.every_n - 1
+            return True
+        return False
+
+    def update(self, detections, latency=None, now=None):
+        now = time.monotonic() if now is None else now
+        velocities = []
+        dt = now - self._detected_at if self._detected_at is not None else 0
+        for det in detections:
+            velocity = (0.0, 0.0, 0.0, 0.0)
+            if dt > 0:
+                same_class = [p for p in self._detections if p[5] == det[5]]
+                best = max(same_class, key=lambda p: _iou(p, det), default=None)
+                if best is not None and _iou(best, det) > 0.3:
+                    velocity = tuple((det[i] - best[i]) / dt for i in range(4))
+            velocities.append(velocity)
+        self._detections = list(detections)
+        self._velocities = velocities
+        self._detected_at = now
+
+        if latency is not None and self.frame_budget:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            self.every_n = max(1, min(self.max_every_n, math.ceil(self._latency / self.frame_budget)))
+
+    # Boxes for a frame on which the detector did not run
+    def predict(self, now=None):
+        if self._detected_at is None:
+            return []
+        now = time.monotonic() if now is None else now
+        if now - self._detected_at > self.max_age:
+            return []
+        dt = min(now - self._detected_at, self.max_extrapolation)
+        return [(int(d[0] + v[0] * dt), int(d[1] + v[1] * dt), int(d[2] + v[2] * dt), int(d[3] + v[3] * dt), d[4], d[5])
+                for d, v in zip(self._detections, self._velocities)]
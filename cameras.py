@@ -0,0 +1,260 @@
+import functools
+import json
+import multiprocessing
+import os
+import queue
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import installed_flask  # noqa: F401  Before a camera process unpickles the app's frame_processor
+from stream import StreamHub
+
+CAMERA_DEFAULTS = {'width': 360, 'height': 640, 'process': True}
+FRAME_SLOTS = 4  # Frames a camera process can get ahead of the web process before slots are reused
+
+
+# Cameras from a JSON file mapping camera id -> {"source": device index, video
+# file or RTSP URL, "width", "height", "process"}. default is used when the
+# file does not exist.
+def load_cameras(path, default):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            cameras = json.load(f)
+    else:
+        cameras = default
+    return {str(camera_id): dict(CAMERA_DEFAULTS, **config) for camera_id, config in cameras.items()}
+
+
+def open_capture(config):
+    source = config['source']
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    cap = cv2.VideoCapture(source)
+    cap.set(3, config['width'])
+    cap.set(4, config['height'])
+    return cap
+
+
+# Camera in the web process, opened on the first read so that importing an
+# app (e.g. in a camera process) never grabs a device
+class LocalCamera:
+    def __init__(self, config):
+        self.config = config
+        self._cap = None
+
+    def read(self):
+        if self._cap is None:
+            self._cap = open_capture(self.config)
+        return self._cap.read()
+
+
+# Ring of frame slots in one SharedMemory block, written by a camera process
+# and read by the web process. Each slot has a header (seq, height, width);
+# the writer sets seq to -1 while copying, so a reader that sees a different
+# seq after its copy knows the frame was overwritten and drops it.
+# The camera process creates the block, the web process unlinks it: frames
+# still queued when a camera process exits (e.g. at the end of a video file)
+# stay readable.
+class SharedFrames:
+    def __init__(self, slot_bytes, slots=FRAME_SLOTS, name=None):
+        header_bytes = slots * 3 * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.slots = slots
+        self.headers = np.ndarray((slots, 3), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, seq, img):
+        h, w = img.shape[:2]
+        header = self.headers[seq % self.slots]
+        header[0] = -1
+        self.data[seq % self.slots, :img.nbytes] = img.reshape(-1)
+        header[1], header[2] = h, w
+        header[0] = seq
+
+    # Copy of frame seq, or None if it has already been overwritten
+    def read(self, seq):
+        header = self.headers[seq % self.slots]
+        if header[0] != seq:
+            return None
+        h, w = int(header[1]), int(header[2])
+        img = self.data[seq % self.slots, :h * w * 3].reshape(h, w, 3).copy()
+        if header[0] != seq:
+            return None
+        return img
+
+    def close(self, unlink=False):
+        self.headers = self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# Entry point of a camera process: capture + process(img) -> (img, state) in
+# a loop, frames go to shared memory and (seq, state) to the results queue.
+# When the web process falls behind, frames are dropped instead of queued.
+# Commands from the web process are passed to control(camera_id, command)
+# between two frames.
+def run_camera(camera_id, config, build_process, results, stop, commands=None, control=None):
+    cap = open_capture(config)
+    process = build_process(camera_id)
+    frames = None
+    seq = 0
+    try:
+        while not stop.is_set():
+            while commands is not None:
+                try:
+                    command = commands.get_nowait()
+                except queue.Empty:
+                    break
+                control(camera_id, command)
+            success, img = cap.read()
+            if not success:
+                break
+            img, state = process(img)
+            if img is None:
+                break
+            img = np.ascontiguousarray(img)
+            if frames is None:
+                frames = SharedFrames(img.nbytes)
+                results.put(('frames', frames.name, img.nbytes))
+            elif img.nbytes > frames.data.shape[1]:
+                continue  # Larger than the slots, the source changed resolution
+            seq += 1
+            frames.write(seq, img)
+            try:
+                results.put_nowait(('frame', seq, state))
+            except queue.Full:
+                pass
+    finally:
+        cap.release()
+        if frames is not None:
+            frames.close()
+
+
+# Handle for a camera running in its own process. Duck-types cv2.VideoCapture
+# (read) so a StreamHub in the web process can encode and serve its frames;
+# the verification state that came with the last frame is kept in .state.
+# The process is started on the first read and again after it exits.
+# send() queues a command for control() in the camera process.
+class CameraProcess:
+    def __init__(self, camera_id, config, build_process, queue_size=2, control=None):
+        self.camera_id = camera_id
+        self.config = config
+        self.build_process = build_process
+        self.queue_size = queue_size
+        self.control = control
+        self.state = None
+        self._process = None
+        self._results = None
+        self._stop = None
+        self._frames = None
+        self._commands = multiprocessing.get_context('spawn').Queue() if control is not None else None
+
+    def _start(self):
+        ctx = multiprocessing.get_context('spawn')
+        self._results = ctx.Queue(self.queue_size)
+        self._stop = ctx.Event()
+        self._process = ctx.Process(target=run_camera, name=f'camera-{self.camera_id}', daemon=True,
+                                    args=(self.camera_id, self.config, self.build_process, self._results, self._stop,
+                                          self._commands, self.control))
+        self._process.start()
+
+    def send(self, command):
+        if self._commands is None:
+            raise ValueError(f"camera {self.camera_id} has no control function")
+        self._commands.put(command)
+
+    def read(self):
+        if self._process is None:
+            self._start()
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    self.release()
+                    return False, None
+                continue
+            if message[0] == 'frames':
+                self._close_frames()
+                self._frames = SharedFrames(message[2], name=message[1])
+                continue
+            _, seq, state = message
+            img = self._frames.read(seq)
+            if img is not None:
+                self.state = state
+                return True, img
+
+    def _close_frames(self):
+        if self._frames is not None:
+            self._frames.close(unlink=True)
+            self._frames = None
+
+    def release(self):
+        if self._process is not None:
+            self._stop.set()
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+        self._close_frames()
+
+
+def _relay(source, on_state):
+    def process(img):
+        if on_state is not None and source.state is not None:
+            on_state(source.camera_id, source.state)
+        return img
+    return process
+
+
+# One StreamHub per configured camera. Cameras with "process": true capture
+# and run inference in their own process (frame_processor(camera_id,
+# with_state=True) is built there); the others run on a thread of the web
+# process with frame_processor(camera_id). tiers are passed to every hub, and
+# control(camera_id, command) handles send() inside camera processes; it has
+# to be a module-level function so it can be pickled.
+class CameraRegistry:
+    def __init__(self, cameras, frame_processor, make_encoder_pool, on_state=None, tiers=None, control=None):
+        self.sources = {}
+        self.hubs = {}
+        for camera_id, config in cameras.items():
+            if config['process']:
+                source = CameraProcess(camera_id, config, functools.partial(frame_processor, with_state=True),
+                                       control=control)
+                process = _relay(source, on_state)
+            else:
+                source = LocalCamera(config)
+                process = frame_processor(camera_id)
+            self.sources[camera_id] = source
+            self.hubs[camera_id] = StreamHub(source, process, make_encoder_pool(), tiers)
+        self.default = next(iter(cameras))
+
+    def hub(self, camera_id=None):
+        return self.hubs.get(self.default if camera_id is None else camera_id)
+
+    # Queue a command for the process of camera_id; False when that camera
+    # does not run in its own process
+    def send(self, camera_id, command):
+        source = self.sources.get(camera_id)
+        if not isinstance(source, CameraProcess):
+            return False
+        source.send(command)
+        return True
+
+    # Last verification state reported by a camera process, None otherwise
+    def state(self, camera_id):
+        source = self.sources.get(camera_id)
+        return getattr(source, 'state', None)
+
+    def __iter__(self):
+        return iter(self.hubs)
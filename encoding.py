@@ -0,0 +1,112 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics import FRAMES_DROPPED, STAGE_SECONDS
+
+_encode_seconds = STAGE_SECONDS.labels('encode')
+_busy_drops = FRAMES_DROPPED.labels('encoder_busy')
+_stale_drops = FRAMES_DROPPED.labels('encoder_stale')
+
+try:
+    from turbojpeg import TurboJPEG
+except ImportError:
+    TurboJPEG = None
+
+# Output size and JPEG quality of a stream: width None keeps the frame size,
+# quality None uses the encoder's own quality
+Tier = collections.namedtuple('Tier', ['width', 'quality'])
+
+
+# JPEG encoder with configurable quality. Uses libjpeg-turbo through PyTurboJPEG
+# when it is installed and loadable, otherwise falls back to cv2.imencode.
+class JpegEncoder:
+    def __init__(self, quality=95, use_turbo=True):
+        self.quality = quality
+        self._turbo = None
+        if use_turbo and TurboJPEG is not None:
+            try:
+                self._turbo = TurboJPEG()
+            except Exception:
+                self._turbo = None
+
+    @property
+    def name(self):
+        return 'turbojpeg' if self._turbo is not None else 'opencv'
+
+    # Returns the encoded bytes, or None if encoding failed
+    def encode(self, img, quality=None):
+        quality = self.quality if quality is None else quality
+        if self._turbo is not None:
+            return self._turbo.encode(img, quality=quality)
+        ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            return None
+        return buffer.tobytes()
+
+
+# Encodes annotated frames on a small thread pool, off the capture/inference
+# thread. Each frame is encoded once (or once per tier, see submit) and handed
+# to publish(); when every worker
+# is busy the frame is dropped instead of queued, and frames that finish after
+# a newer one are discarded so subscribers never go back in time.
+class EncoderPool:
+    def __init__(self, encoder, workers=2):
+        self.encoder = encoder
+        self.workers = workers
+        self.dropped = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='jpeg-encoder')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._seq = 0
+        self._published_seq = 0
+
+    # Returns False when the frame was dropped because the pool is saturated.
+    # With tiers, publish() gets {tier: bytes} instead of the bytes of one JPEG
+    def submit(self, img, publish, tiers=None):
+        with self._lock:
+            if self._pending >= self.workers:
+                self.dropped += 1
+                _busy_drops.inc()
+                return False
+            self._pending += 1
+            self._seq += 1
+            seq = self._seq
+        self._executor.submit(self._encode, img, seq, publish, tiers)
+        return True
+
+    # Frame resized once per distinct width and encoded once per tier
+    def _encode_tiers(self, img, tiers):
+        h, w = img.shape[:2]
+        resized = {}
+        out = {}
+        for tier in tiers:
+            width = tier.width if tier.width and tier.width < w else None
+            if width not in resized:
+                resized[width] = img if width is None else cv2.resize(
+                    img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+            data = self.encoder.encode(resized[width], tier.quality)
+            if data is not None:
+                out[tier] = data
+        return out or None
+
+    def _encode(self, img, seq, publish, tiers=None):
+        start = time.perf_counter()
+        try:
+            data = self.encoder.encode(img) if tiers is None else self._encode_tiers(img, tiers)
+        finally:
+            _encode_seconds.observe(time.perf_counter() - start)
+            with self._lock:
+                self._pending -= 1
+        if data is None:
+            return
+        with self._lock:
+            if seq <= self._published_seq:
+                self.dropped += 1
+                _stale_drops.inc()
+                return
+            self._published_seq = seq
+            publish(data)
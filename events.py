@@ -0,0 +1,102 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+
+
+# Format one event as a Server-Sent Events message
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+# Bounded per-client event queue. Old events are dropped when a client falls
+# behind. Readers can block on it from a thread or await it from an event loop.
+class EventSubscription:
+    def __init__(self, maxlen=64, loop=None):
+        self._events = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._loop = loop
+        self._async_event = asyncio.Event() if loop is not None else None
+
+    def push(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_event.set)
+
+    def _drain(self):
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    # Wait up to timeout seconds and return all pending events (maybe empty)
+    def get(self, timeout=15):
+        with self._cond:
+            self._cond.wait_for(lambda: self._events, timeout)
+            return self._drain()
+
+    async def aget(self, timeout=15):
+        try:
+            await asyncio.wait_for(self._async_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_event.clear()
+        with self._cond:
+            return self._drain()
+
+
+# Pushes structured verification events per session to SSE subscribers.
+# publish_state() is called every frame but only emits when something the
+# client cares about changed (detection, countdown second, verdict, reset).
+class EventBus:
+    def __init__(self):
+        self._subscribers = {}  # session id -> set of EventSubscription
+        self._last_state = {}  # session id -> last emitted state key
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id, loop=None):
+        subscription = EventSubscription(loop=loop)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, session_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[session_id]
+                    self._last_state.pop(session_id, None)
+
+    def publish(self, session_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def publish_state(self, session, confidence=None):
+        if session.session_id in self._subscribers:
+            self.publish_snapshot(session.session_id, session.to_dict(), confidence)
+
+    # Same as publish_state for a state dict produced elsewhere, e.g. by a camera process
+    def publish_snapshot(self, session_id, state, confidence=None):
+        if session_id not in self._subscribers:
+            return
+        state = dict(state)
+        if state['verification_status']:
+            event_type = 'result'
+        elif state['is_resetting']:
+            event_type = 'reset'
+        else:
+            event_type = 'progress'
+        key = (event_type, state['detection'], state['countdown'], state['reset_countdown'])
+        if self._last_state.get(session_id) == key:
+            return
+        self._last_state[session_id] = key
+        state['type'] = event_type
+        state['confidence'] = confidence
+        state['timestamp'] = time.time()
+        self.publish(session_id, state)
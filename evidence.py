@@ -0,0 +1,153 @@
+import collections
+import datetime
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import cv2
+
+from metrics import EVIDENCE_CLIPS
+
+_written = EVIDENCE_CLIPS.labels('written')
+_dropped = EVIDENCE_CLIPS.labels('dropped')
+_skipped = EVIDENCE_CLIPS.labels('skipped')
+_errors = EVIDENCE_CLIPS.labels('error')
+
+
+# Pre-roll of one session: the last pre_roll seconds of frames with their
+# detections, as JPEGs scaled down to max_width and capped at max_bytes, so a
+# session holds a few MB at most. Encoding a small JPEG takes about a
+# millisecond in the frame loop; the disk is only touched by the writer thread.
+class EvidenceBuffer:
+    __slots__ = ('pre_roll', 'max_width', 'max_bytes', 'params', 'frames', 'nbytes')
+
+    def __init__(self, pre_roll=3.0, max_width=360, max_bytes=4 * 1024 * 1024, jpeg_quality=85):
+        self.pre_roll = pre_roll
+        self.max_width = max_width
+        self.max_bytes = max_bytes
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.frames = collections.deque()  # (timestamp, jpeg, detections, scale)
+        self.nbytes = 0
+
+    def add(self, img, detections, now=None):
+        now = time.monotonic() if now is None else now
+        h, w = img.shape[:2]
+        scale = 1.0
+        if self.max_width and w > self.max_width:
+            scale = self.max_width / w
+            img = cv2.resize(img, (self.max_width, max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode('.jpg', img, self.params)
+        if not ok:
+            return
+        data = buf.tobytes()
+        self.frames.append((now, data, detections, scale))
+        self.nbytes += len(data)
+        while self.frames and (self.frames[0][0] < now - self.pre_roll or self.nbytes > self.max_bytes):
+            self.nbytes -= len(self.frames.popleft()[1])
+
+    # Buffered frames, oldest first; the buffer is empty afterwards
+    def drain(self):
+        frames = list(self.frames)
+        self.frames.clear()
+        self.nbytes = 0
+        return frames
+
+
+def _safe_name(text):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(text))[:64]
+
+
+# Writes the pre-roll of a session to disk when it gets a verdict: every
+# FAILED one and a success_sample fraction of SUCCESS ones. Each clip is one
+# .mjpeg file (concatenated JPEGs, playable with ffmpeg -f mjpeg) written in a
+# single call, next to a .json sidecar with the verification state and per
+# frame timestamp, byte range, scale (clip pixels / frame pixels) and
+# detections in frame coordinates.
+#
+# Clips are handed to a background writer through a queue of max_pending
+# clips; when the disk falls behind, new clips are dropped and counted
+# instead of blocking the frame loop.
+class EvidenceRecorder:
+    def __init__(self, directory, class_names=None, pre_roll=3.0, success_sample=0.1, max_width=360,
+                 max_bytes=4 * 1024 * 1024, max_pending=4, jpeg_quality=85):
+        self.directory = directory
+        self.class_names = class_names
+        self.pre_roll = pre_roll
+        self.success_sample = success_sample
+        self.max_width = max_width
+        self.max_bytes = max_bytes
+        self.jpeg_quality = jpeg_quality
+        self.last_error = None
+        self._queue = queue.Queue(max_pending)
+        self._worker = threading.Thread(target=self._run, name='evidence-writer', daemon=True)
+        self._worker.start()
+
+    def buffer(self):
+        return EvidenceBuffer(self.pre_roll, self.max_width, self.max_bytes, self.jpeg_quality)
+
+    # Queue the buffered frames of a session that just got verdict. Never
+    # blocks; returns False when the clip was skipped or dropped
+    def submit(self, session_id, verdict, buffer, state=None):
+        frames = buffer.drain()
+        if not frames:
+            return False
+        if verdict != 'FAILED' and random.random() >= self.success_sample:
+            _skipped.inc()
+            return False
+        try:
+            self._queue.put_nowait((session_id, verdict, frames, state, datetime.datetime.now()))
+        except queue.Full:
+            _dropped.inc()
+            return False
+        return True
+
+    def _collect(self):
+        clips = [self._queue.get()]
+        while True:
+            try:
+                clips.append(self._queue.get_nowait())
+            except queue.Empty:
+                return clips
+
+    def _run(self):
+        while True:
+            for clip in self._collect():
+                try:
+                    self._write(*clip)
+                except (OSError, ValueError) as e:
+                    self.last_error = e
+                    _errors.inc()
+                else:
+                    _written.inc()
+
+    def _detection(self, det):
+        x1, y1, x2, y2, conf, cls = det
+        label = self.class_names[cls] if self.class_names else cls
+        return {'box': [x1, y1, x2, y2], 'confidence': conf, 'class': label}
+
+    def _write(self, session_id, verdict, frames, state, recorded_at):
+        chunks, index, offset = [], [], 0
+        start = frames[0][0]
+        for timestamp, data, detections, scale in frames:
+            chunks.append(data)
+            index.append({'time': round(timestamp - start, 3), 'offset': offset, 'size': len(data),
+                          'scale': round(scale, 4), 'detections': [self._detection(d) for d in detections]})
+            offset += len(data)
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = f"{recorded_at:%Y%m%d-%H%M%S-%f}-{_safe_name(session_id)}-{verdict}"
+        video = os.path.join(self.directory, base + '.mjpeg')
+        sidecar = {
+            'session_id': session_id, 'verdict': verdict, 'recorded_at': recorded_at.isoformat(),
+            'video': base + '.mjpeg', 'format': 'mjpeg', 'state': state, 'frames': index,
+        }
+        # Written under a temporary name first so readers never see a partial clip
+        for path, data in ((video, b''.join(chunks)), (os.path.join(self.directory, base + '.json'),
+                                                         json.dumps(sidecar, indent=1).encode())):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
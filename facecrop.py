@@ -0,0 +1,83 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+
+
+# Cheap first stage for two-stage inference: finds the face region so the
+# anti-spoofing model only sees a fixed-size crop around it, and not at all
+# when nobody is in front of the camera.
+#
+# The last tracked box (plus margin) is reused while it is fresh; otherwise
+# OpenCV's bundled Haar cascade runs on a small grayscale copy of the frame.
+class FaceLocator:
+    def __init__(self, crop_size=320, margin=0.5, detect_width=160, min_face=24, cascade=None):
+        self.crop_size = crop_size
+        self.margin = margin
+        self.detect_width = detect_width
+        self.min_face = min_face
+        self.cascade = cascade or os.path.join(cv2.data.haarcascades, HAAR_CASCADE)
+        self._local = threading.local()  # CascadeClassifier is not safe to share between threads
+        self._classifier()
+
+    def _classifier(self):
+        classifier = getattr(self._local, 'classifier', None)
+        if classifier is None:
+            if not hasattr(cv2, 'CascadeClassifier'):
+                raise ValueError("This OpenCV build has no Haar cascades, install opencv-python 4.x")
+            classifier = cv2.CascadeClassifier(self.cascade)
+            if classifier.empty():
+                raise ValueError(f"Could not load face cascade {self.cascade}")
+            self._local.classifier = classifier
+        return classifier
+
+    # Face box (x1, y1, x2, y2) in frame pixels, or None when there is no face.
+    # hints are recent detections; the largest one is used instead of the cascade
+    def locate(self, img, hints=()):
+        if hints:
+            x1, y1, x2, y2 = max(hints, key=lambda d: (d[2] - d[0]) * (d[3] - d[1]))[:4]
+            return x1, y1, x2, y2
+        h, w = img.shape[:2]
+        scale = min(1.0, self.detect_width / w)
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        faces = self._classifier().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=4,
+                                                    minSize=(self.min_face, self.min_face))
+        if not len(faces):
+            return None
+        x, y, fw, fh = max(faces, key=lambda f: f[2] * f[3])
+        return int(x / scale), int(y / scale), int((x + fw) / scale), int((y + fh) / scale)
+
+    # Square crop around box with margin, kept inside the frame and resized so
+    # its longer side is crop_size, up or down, so the classifier always sees
+    # faces at the same scale. Returns (crop, (scale, offset_x, offset_y)) where
+    # frame = crop * scale + offset.
+    def crop(self, img, box):
+        h, w = img.shape[:2]
+        x1, y1, x2, y2 = box
+        side = int(max(x2 - x1, y2 - y1) * (1 + 2 * self.margin))
+        cw, ch = min(side, w), min(side, h)
+        left = min(max(0, (x1 + x2 - cw) // 2), w - cw)
+        top = min(max(0, (y1 + y2 - ch) // 2), h - ch)
+        region = img[top:top + ch, left:left + cw]
+        scale = self.crop_size / max(cw, ch)
+        if scale == 1.0:
+            return np.ascontiguousarray(region), (1.0, left, top)
+        region = cv2.resize(region, (max(1, round(cw * scale)), max(1, round(ch * scale))),
+                            interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+        return region, (1 / scale, left, top)
+
+
+# Map an (N, 6) detections array from crop coordinates back onto the frame
+def to_frame(dets, transform):
+    if not len(dets):
+        return dets
+    scale, left, top = transform
+    dets = dets.copy()
+    dets[:, [0, 2]] = np.trunc(dets[:, [0, 2]] * scale + left)
+    dets[:, [1, 3]] = np.trunc(dets[:, [1, 3]] * scale + top)
+    return dets
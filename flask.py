@@ -1,193 +1,480 @@
-import math
+import os
 import time
-import cv2
 import cvzone
-from ultralytics import YOLO
-from flask import Flask, Response
+from backends import LazyModel
+from batching import InferenceScheduler
+from cadence import CadenceTracker
+from cameras import CameraRegistry, load_cameras
+from encoding import EncoderPool, JpegEncoder
+from events import EventBus, format_sse
+from evidence import EvidenceRecorder
+from facecrop import FaceLocator, to_frame
+from h264 import FMP4_MIMETYPE, H264Stream
+from inference_server import RemoteModel
+from metrics import (ACTIVE_SESSIONS, CONTENT_TYPE, FRAMES, REGISTRY, STAGE_SECONDS, STREAM_FPS,
+                     VERIFICATIONS, FpsMeter)
+from postprocess import box_array, extract_detections, to_detections
+from resultcache import ResultCache
+from session import SessionRegistry, parse_settings
+from upload import FrameDecoder, UploadTooLarge
+from flask import Flask, Response, abort, jsonify, request
 
 # Inisialisasi Flask app
 app = Flask(__name__)
 
 # Inisialisasi model YOLO
-model = YOLO("../models/best_204.pt")
+MODEL_BACKEND = "torch"  # torch, onnx, onnx-int8 atau openvino (hasil export disimpan di samping weights)
+WARMUP_RUNS = 2  # Jumlah frame dummy untuk warm-up sebelum /readyz melaporkan siap
+# Alamat inference_server.py (mis. "127.0.0.1:6000") yang dipakai bersama oleh beberapa worker web,
+# sehingga model hanya dimuat sekali per proses inferensi. None = model dimuat di proses ini
+INFERENCE_SERVER = None
+if INFERENCE_SERVER:
+    model = RemoteModel(INFERENCE_SERVER)
+else:
+    # Model dimuat di background saat create_app() atau request pertama, bukan saat import
+    model = LazyModel("../models/best_204.pt", MODEL_BACKEND, warmup=WARMUP_RUNS)
 confidence = 0.6
 classNames = ["fake", "real"]
 
-# Membuka kamera
-cap = cv2.VideoCapture(0)  # Untuk Webcam
-cap.set(3, 360)  # Lebar (9 bagian)
-cap.set(4, 640)  # Tinggi (16 bagian)
-
-# Menghitung FPS
-prev_frame_time = 0
-new_frame_time = 0
-
-# Variabel untuk tracking deteksi wajah
-face_detection_start = None
-current_detection = None
-verification_status = None
-show_notification = False
-notification_start = None
-is_resetting = False
-reset_countdown = 0
+# Inferensi batch untuk semua stream yang aktif
+BATCH_SIZE = 8  # Jumlah frame maksimum per batch
+BATCH_MAX_WAIT = 0.005  # Waktu tunggu maksimum untuk mengisi batch dalam detik
+scheduler = InferenceScheduler(model, max_batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT)
+
+# Jalankan detektor setiap N frame, frame di antaranya memakai tracking box terakhir
+INFERENCE_EVERY_N = 3
+INFERENCE_FRAME_BUDGET = None  # Detik inferensi per frame; jika diisi, N menyesuaikan latency
+
+# Mode dua tahap: wajah dicari dulu (box terakhir atau Haar cascade), model hanya dijalankan
+# pada crop wajah dan dilewati sama sekali jika tidak ada wajah
+FACE_ROI = False
+FACE_ROI_SIZE = 320  # Sisi terpanjang crop wajah dalam pixel
+face_locator = FaceLocator(FACE_ROI_SIZE) if FACE_ROI else None
+
+# Frame yang hampir sama dengan frame terakhir yang diinferensi memakai ulang hasilnya
+RESULT_CACHE_TOLERANCE = 3.0  # Rata-rata selisih pixel (0-255) thumbnail 32x32; None = nonaktif
+RESULT_CACHE_MAX_AGE = 1.0  # Umur maksimum hasil yang dipakai ulang dalam detik
+
 RESET_COUNTDOWN_DURATION = 3  # Durasi countdown reset dalam detik
 NOTIFICATION_DURATION = 3  # Durasi notifikasi dalam detik
 VERIFICATION_THRESHOLD = 10  # Waktu yang dibutuhkan untuk verifikasi dalam detik
+# Skor agregat (EMA confidence, 0-1) yang cukup untuk verdict sebelum VERIFICATION_THRESHOLD,
+# bila bertahan EARLY_DECISION_SECONDS detik; None = selalu menunggu VERIFICATION_THRESHOLD
+EARLY_DECISION_SCORE = 0.85
+EARLY_DECISION_SECONDS = 3
+
+# State verifikasi per sesi/stream, sesi yang idle akan dihapus
+sessions = SessionRegistry(verification_threshold=VERIFICATION_THRESHOLD,
+                           notification_duration=NOTIFICATION_DURATION,
+                           reset_countdown_duration=RESET_COUNTDOWN_DURATION,
+                           decide_score=EARLY_DECISION_SCORE,
+                           min_evidence=EARLY_DECISION_SECONDS,
+                           confidence=confidence)
+CAMERA_SESSION_ID = "camera"
+
+# Kamera dari cameras.json (id -> source, width, height, process). Tanpa file tersebut hanya
+# webcam lokal di bawah ini yang dipakai, dengan capture di thread proses web
+CAMERAS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cameras.json")
+DEFAULT_CAMERAS = {CAMERA_SESSION_ID: {"source": 0,  # Untuk Webcam
+                                       "width": 360, "height": 640,  # Lebar 9 : tinggi 16
+                                       "process": False}}
+cameras = load_cameras(CAMERAS_CONFIG, DEFAULT_CAMERAS)
+
+UPLOAD_MAX_WIDTH = 640  # Frame upload yang lebih lebar di-decode dengan skala lebih kecil
+
+# Event verifikasi terstruktur per sesi untuk client SSE (/events/<session_id>)
+event_bus = EventBus()
+HEADLESS = False  # True = lewati semua gambar overlay, hasil hanya dikirim lewat event
+
+# Rekaman bukti untuk audit: frame beberapa detik terakhir sebelum setiap verdict FAILED (dan sebagian
+# SUCCESS) disimpan sebagai JPEG kecil (maks. 4 MB per sesi) dan ditulis ke EVIDENCE_DIR oleh thread
+# background, tanpa menahan loop frame
+EVIDENCE_DIR = None  # Path absolut, mis. "/var/lib/liveness/evidence"; None = nonaktif
+EVIDENCE_PRE_ROLL = 3  # Detik frame sebelum verdict yang disimpan
+EVIDENCE_SUCCESS_SAMPLE = 0.1  # Bagian verdict SUCCESS yang ikut direkam
+EVIDENCE_UPLOADS = False  # True = sesi upload client juga direkam, bukan hanya kamera
+evidence_recorder = (EvidenceRecorder(EVIDENCE_DIR, classNames, EVIDENCE_PRE_ROLL,
+                                      success_sample=EVIDENCE_SUCCESS_SAMPLE) if EVIDENCE_DIR else None)
+
+# Metrik untuk /metrics, FPS dihitung per detik dan tidak lagi di-print setiap frame
+upload_frames = FRAMES.labels('upload')
+inference_seconds = STAGE_SECONDS.labels('inference')
+drawing_seconds = STAGE_SECONDS.labels('drawing')
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+
+
+# Deteksi wajah dengan YOLO, atau perkiraan dari deteksi terakhir pada frame yang dilewati.
+# Mengembalikan list (x1, y1, x2, y2, conf, cls) di atas ambang confidence
+def detect_faces(img, session):
+    if session.cadence is None:
+        session.cadence = CadenceTracker(INFERENCE_EVERY_N, INFERENCE_FRAME_BUDGET)
+    if not session.cadence.should_infer():
+        return session.cadence.predict()
+
+    thumb = None
+    if RESULT_CACHE_TOLERANCE is not None:
+        if session.result_cache is None:
+            session.result_cache = ResultCache(RESULT_CACHE_TOLERANCE, RESULT_CACHE_MAX_AGE)
+        thumb = session.result_cache.fingerprint(img)
+        detections = session.result_cache.lookup(thumb)
+        if detections is not None:
+            session.cadence.update(detections)  # Frame hampir sama, model tidak dijalankan
+            return detections
+
+    start = time.perf_counter()
+    if face_locator is None:
+        detections = extract_detections(scheduler.infer(img, session.session_id), session.confidence)
+    else:
+        detections = detect_in_face_roi(img, session)
+    latency = time.perf_counter() - start
+    inference_seconds.observe(latency)
+    session.cadence.update(detections, latency)
+    if thumb is not None:
+        session.result_cache.store(thumb, detections)
+    return detections
+
+
+# Mode dua tahap: jalankan model pada crop wajah saja, tanpa inferensi jika tidak ada wajah
+def detect_in_face_roi(img, session):
+    box = face_locator.locate(img, session.cadence.predict())
+    if box is None:
+        return []
+    crop, transform = face_locator.crop(img, box)
+    dets = box_array(scheduler.infer(crop, session.session_id), session.confidence)
+    return to_detections(to_frame(dets, transform))
+
+
+# Menggambar countdown sebelum scan baru dimulai
+def draw_reset_countdown(img, session):
+    if session.reset_countdown > 0:
+        cvzone.putTextRect(img, f"Starting new scan in: {int(session.reset_countdown)}s",
+                           (int(img.shape[1] / 2) - 150, int(img.shape[0] / 2)),
+                           scale=2, thickness=2, colorR=(255, 165, 0))
+        cvzone.putTextRect(img, "Please position your face",
+                           (int(img.shape[1] / 2) - 120, int(img.shape[0] / 2) + 40),
+                           scale=1, thickness=1)
+
+
+# Menggambar bounding box, countdown verifikasi dan notifikasi hasil
+def draw_overlay(img, session, detections, current_frame_detection):
+    for x1, y1, x2, y2, conf, cls in detections:
+        w, h = x2 - x1, y2 - y1
+
+        if classNames[cls] == 'real':
+            color = (0, 255, 0)  # Green for 'real'
+        else:
+            color = (0, 0, 255)  # Red for 'fake'
 
+        # Draw the bounding box and label
+        cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
+        cvzone.putTextRect(img, f'{classNames[cls].upper()} {int(conf * 100)}%',
+                           (max(0, x1), max(35, y1)), scale=2, thickness=4, colorR=color,
+                           colorB=color)
 
-def reset_verification():
-    global face_detection_start, current_detection, verification_status, show_notification, is_resetting, reset_countdown
-    face_detection_start = None
-    current_detection = None
-    verification_status = None
-    show_notification = False
-    is_resetting = True
-    reset_countdown = RESET_COUNTDOWN_DURATION
+    if session.is_verifying:
+        if current_frame_detection:
+            # Tampilkan countdown verifikasi
+            countdown = max(0, session.verification_threshold - int(session.verification_timer))
+            if countdown > 0:
+                cvzone.putTextRect(img, f"Verifying: {countdown}s",
+                                   (10, img.shape[0] - 20), scale=2, thickness=2)
+                # Tambahkan instruksi untuk pengguna
+                cvzone.putTextRect(img, "Keep your face steady",
+                                   (10, img.shape[0] - 60), scale=1, thickness=1)
+        else:
+            # Reset jika tidak ada wajah terdeteksi
+            cvzone.putTextRect(img, "No face detected! Please position your face.",
+                               (10, img.shape[0] - 20), scale=1, thickness=1)
+
+    # Tampilkan notifikasi hasil
+    if session.show_notification:
+        if session.verification_status == "SUCCESS":
+            cvzone.putTextRect(img, "Verification Successful!",
+                               (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2)),
+                               scale=2, thickness=2, colorR=(0, 255, 0))
+        else:
+            cvzone.putTextRect(img, "Verification Failed!",
+                               (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2)),
+                               scale=2, thickness=2, colorR=(0, 0, 255))
+        cvzone.putTextRect(img, "Next scan starts shortly",
+                           (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2) + 40),
+                           scale=1, thickness=1)
+
+
+# Logika reset, deteksi dan verifikasi untuk satu frame, tanpa menggambar.
+# Mengembalikan (detections, current_frame_detection), atau None selama countdown reset
+def update_session(img, session):
+    # Handle reset countdown
+    if session.is_resetting:
+        session.tick_reset()
+        event_bus.publish_state(session)
+        return None
+
+    detections = detect_faces(img, session)
+    current_frame_detection = classNames[detections[-1][5]] if detections else None
+
+    # Logic verifikasi wajah
+    confidence = detections[-1][4] if detections else None
+    if session.evidence is not None:
+        session.evidence.add(img, detections)  # Sebelum overlay digambar
+    result = session.update(current_frame_detection, confidence=confidence)
+    if result:
+        VERIFICATIONS.labels(result).inc()
+        if session.evidence is not None:
+            evidence_recorder.submit(session.session_id, result, session.evidence, session.to_dict())
+    event_bus.publish_state(session, confidence)
+    return detections, current_frame_detection
+
+
+# Memproses satu frame: logika reset, deteksi, verifikasi dan overlay
+def annotate_frame(img, session):
+    session.apply_requests()  # Reset/pengaturan dari HTTP diterapkan di antara frame
+    if session.is_resetting:
+        if not HEADLESS:
+            start = time.perf_counter()
+            draw_reset_countdown(img, session)
+            drawing_seconds.observe(time.perf_counter() - start)
+        update_session(img, session)
+        return
+
+    detections, current_frame_detection = update_session(img, session)
+    if not HEADLESS:
+        start = time.perf_counter()
+        draw_overlay(img, session, detections, current_frame_detection)
+        drawing_seconds.observe(time.perf_counter() - start)
+
+
+# Fungsi pemroses frame untuk satu kamera, hasilnya di-encode oleh encoder pool.
+# Di proses kamera (with_state=True) state verifikasi ikut dikembalikan
+def frame_processor(camera_id, with_state=False):
+    fps_meter = FpsMeter(STREAM_FPS.labels(camera_id))
+    camera_frames = FRAMES.labels(camera_id)
+
+    def process_frame(img):
+        session = sessions.get(camera_id)
+        if evidence_recorder is not None and session.evidence is None:
+            session.evidence = evidence_recorder.buffer()
+        annotate_frame(img, session)
+        camera_frames.inc()
+        fps_meter.tick()
+        return (img, session.to_dict()) if with_state else img
+
+    return process_frame
+
+
+# Perintah (reset, settings) untuk sesi di proses ini; juga dipanggil di proses kamera untuk
+# perintah dari proses web. Diterapkan oleh loop frame di antara dua frame
+def control_session(session_id, command):
+    reset, settings = command
+    sessions.get(session_id).request(reset, settings)
+
+
+# True jika session_id adalah sesi yang sudah ada atau kamera dari cameras.json
+def known_session(session_id):
+    return sessions.find(session_id) is not None or camera_registry.hub(session_id) is not None
+
+
+# Kirim perintah ke proses kamera yang memiliki sesi tersebut, atau ke sesi lokal
+def send_command(session_id, reset=False, settings=None):
+    command = (reset, settings or {})
+    if not camera_registry.send(session_id, command):
+        control_session(session_id, command)
+
+
+# Verifikasi satu frame yang dikirim client (tanpa kamera server). Frame upload datang sesuai
+# kecepatan client (bisa hanya ~1 fps), jadi setiap frame diinferensi, bukan setiap INFERENCE_EVERY_N
+def verify_frame(img, session):
+    if session.cadence is None:
+        session.cadence = CadenceTracker(1)
+    if EVIDENCE_UPLOADS and evidence_recorder is not None and session.evidence is None:
+        session.evidence = evidence_recorder.buffer()
+    session.apply_requests()
+    state = update_session(img, session)
+    upload_frames.inc()
+    detections = state[0] if state else []
+    return dict(session.to_dict(), frame_size=[img.shape[1], img.shape[0]],
+                detections=[{'box': [x1, y1, x2, y2], 'confidence': conf, 'class': classNames[cls]}
+                            for x1, y1, x2, y2, conf, cls in detections])
+
+
+# Encode JPEG di thread pool terpisah, sekali per frame untuk semua client
+JPEG_QUALITY = 95  # Kualitas JPEG (0-100), lebih rendah = bandwidth lebih kecil
+ENCODER_WORKERS = 2  # Jumlah thread encoder
+# Tier (lebar, kualitas) untuk /video?w=240&q=60, dari yang terbaik. Setiap tier di-resize dan
+# di-encode sekali per frame untuk semua client-nya; lebar None = ukuran asli frame
+STREAM_TIERS = [(None, JPEG_QUALITY), (360, 80), (240, 60), (160, 40)]
+ADAPTIVE_TIERS = True  # True = client yang tertinggal pindah ke tier yang lebih rendah
+
+# Satu capture + inferensi per kamera (thread atau proses sendiri) yang dibagikan ke semua client /video
+camera_registry = CameraRegistry(cameras, frame_processor,
+                                 lambda: EncoderPool(JpegEncoder(JPEG_QUALITY), ENCODER_WORKERS),
+                                 event_bus.publish_snapshot, STREAM_TIERS, control_session)
+stream_hub = camera_registry.hub()  # Kamera default untuk /video
+encoder_pool = stream_hub.encoder_pool
+
+# Mode stream H.264 opsional (fragmented MP4 untuk <video>) di /video.mp4, bandwidth jauh lebih
+# kecil dari MJPEG untuk wajah yang hampir diam. Butuh ffmpeg dengan libx264 di PATH
+H264_STREAM = False
+H264_FPS = 15  # Frame per detik yang di-encode, frame terakhir diulang jika inferensi lebih lambat
+H264_BITRATE = "500k"
+h264_streams = {}
+if H264_STREAM:
+    for camera_id in camera_registry:
+        h264_streams[camera_id] = H264Stream(H264_FPS, H264_BITRATE)
+        camera_registry.hub(camera_id).attach(h264_streams[camera_id])
 
 
-def start_new_verification():
-    global is_resetting, reset_countdown
-    is_resetting = False
-    reset_countdown = 0
+# Fungsi untuk menangani stream video
+def generate_frames(camera_id=None, width=None, quality=None):
+    hub = camera_registry.hub(camera_id)
+    return hub.subscribe(hub.tier(width, quality), ADAPTIVE_TIERS)
 
 
-# Fungsi untuk menangani stream video
-def generate_frames():
-    global prev_frame_time, face_detection_start, current_detection, verification_status
-    global show_notification, notification_start, is_resetting, reset_countdown
-
-    while True:
-        new_frame_time = time.time()
-        success, img = cap.read()
-
-        if not success:
-            break
-
-        # Handle reset countdown
-        if is_resetting:
-            if reset_countdown > 0:
-                cvzone.putTextRect(img, f"Starting new scan in: {int(reset_countdown)}s",
-                                   (int(img.shape[1] / 2) - 150, int(img.shape[0] / 2)),
-                                   scale=2, thickness=2, colorR=(255, 165, 0))
-                cvzone.putTextRect(img, "Please position your face",
-                                   (int(img.shape[1] / 2) - 120, int(img.shape[0] / 2) + 40),
-                                   scale=1, thickness=1)
-                reset_countdown -= 1 / 30  # Assuming 30 FPS
-            else:
-                start_new_verification()
-
-            # Convert frame to JPEG during reset countdown
-            ret, buffer = cv2.imencode('.jpg', img)
-            if not ret:
-                break
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-            continue
-
-        results = model(img, stream=True, verbose=False)
-        current_frame_detection = None
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                # Bounding Box
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                w, h = x2 - x1, y2 - y1
-                # Confidence
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                # Class Name
-                cls = int(box.cls[0])
-
-                if conf > confidence:
-                    current_frame_detection = classNames[cls]
-
-                    if classNames[cls] == 'real':
-                        color = (0, 255, 0)  # Green for 'real'
-                    else:
-                        color = (0, 0, 255)  # Red for 'fake'
-
-                    # Draw the bounding box and label
-                    cvzone.cornerRect(img, (x1, y1, w, h), colorC=color, colorR=color)
-                    cvzone.putTextRect(img, f'{classNames[cls].upper()} {int(conf * 100)}%',
-                                       (max(0, x1), max(35, y1)), scale=2, thickness=4, colorR=color,
-                                       colorB=color)
-
-        # Logic verifikasi wajah
-        if current_frame_detection:
-            if current_detection != current_frame_detection:
-                current_detection = current_frame_detection
-                face_detection_start = time.time()
-            elif face_detection_start and not verification_status:
-                elapsed_time = time.time() - face_detection_start
-
-                # Tampilkan countdown verifikasi
-                countdown = max(0, VERIFICATION_THRESHOLD - int(elapsed_time))
-                if countdown > 0:
-                    cvzone.putTextRect(img, f"Verifying: {countdown}s",
-                                       (10, img.shape[0] - 20), scale=2, thickness=2)
-                    # Tambahkan instruksi untuk pengguna
-                    cvzone.putTextRect(img, "Keep your face steady",
-                                       (10, img.shape[0] - 60), scale=1, thickness=1)
-
-                if elapsed_time >= VERIFICATION_THRESHOLD:
-                    verification_status = "SUCCESS" if current_detection == "real" else "FAILED"
-                    show_notification = True
-                    notification_start = time.time()
-        else:
-            if face_detection_start and not verification_status:
-                # Reset jika tidak ada wajah terdeteksi
-                cvzone.putTextRect(img, "No face detected! Please position your face.",
-                                   (10, img.shape[0] - 20), scale=1, thickness=1)
-                if time.time() - face_detection_start > 2:  # Reset after 2 seconds of no detection
-                    reset_verification()
-
-        # Tampilkan notifikasi hasil
-        if show_notification:
-            notification_elapsed = time.time() - notification_start
-            if notification_elapsed < NOTIFICATION_DURATION:
-                if verification_status == "SUCCESS":
-                    cvzone.putTextRect(img, "Verification Successful!",
-                                       (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2)),
-                                       scale=2, thickness=2, colorR=(0, 255, 0))
-                else:
-                    cvzone.putTextRect(img, "Verification Failed!",
-                                       (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2)),
-                                       scale=2, thickness=2, colorR=(0, 0, 255))
-                cvzone.putTextRect(img, "Press 'R' to scan again",
-                                   (int(img.shape[1] / 2) - 100, int(img.shape[0] / 2) + 40),
-                                   scale=1, thickness=1)
-            else:
-                reset_verification()  # Auto-reset after notification duration
-
-        # Menghitung FPS
-        fps = 1 / (new_frame_time - prev_frame_time)
-        prev_frame_time = new_frame_time
-        print(fps)
-
-        # Handle keyboard input
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('r') or key == ord('R'):
-            reset_verification()
-
-        # Mengubah frame menjadi format JPEG
-        ret, buffer = cv2.imencode('.jpg', img)
-        if not ret:
-            break
-        frame = buffer.tobytes()
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-
-
-# Route untuk menampilkan video stream
+# State verifikasi sesi lokal atau kamera di proses lain, None jika tidak dikenal
+def find_state(session_id):
+    session = sessions.find(session_id)
+    if session is not None:
+        return session.to_dict()
+    return camera_registry.state(session_id)
+
+
+# Route untuk menampilkan video stream, ?w=<lebar>&q=<kualitas> memilih tier
 @app.route('/video')
 def video():
-    return Response(generate_frames(),
+    return Response(generate_frames(None, request.args.get('w', type=int),
+                                    request.args.get('q', type=int)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+# Route untuk video stream dari satu kamera di cameras.json
+@app.route('/video/<camera_id>')
+def camera_video(camera_id):
+    if camera_registry.hub(camera_id) is None:
+        abort(404)
+    return Response(generate_frames(camera_id, request.args.get('w', type=int),
+                                    request.args.get('q', type=int)),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+# Route stream H.264 (fragmented MP4) untuk <video>, hanya jika H264_STREAM aktif
+@app.route('/video.mp4')
+@app.route('/video.mp4/<camera_id>')
+def video_mp4(camera_id=None):
+    camera_id = camera_id or camera_registry.default
+    stream = h264_streams.get(camera_id)
+    if stream is None:
+        abort(404)
+    camera_registry.hub(camera_id).ensure_started()
+    return Response(stream.subscribe(), mimetype=FMP4_MIMETYPE, headers={'Cache-Control': 'no-cache'})
+
+
+# Route Server-Sent Events untuk hasil verifikasi satu sesi
+@app.route('/events/<session_id>')
+def verification_events(session_id):
+    def stream():
+        subscription = event_bus.subscribe(session_id)
+        try:
+            state = find_state(session_id)
+            if state is not None:
+                yield format_sse(dict(state, type='state'))
+            while True:
+                events = subscription.get(timeout=15)
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(session_id, subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Route untuk verifikasi frame JPEG yang dikirim client (body request = satu frame)
+@app.route('/verify/<session_id>/frame', methods=['POST'])
+def verify_uploaded_frame(session_id):
+    session = sessions.get(session_id)
+    # Request paralel untuk sesi yang sama berbagi buffer decoder dan state verifikasi
+    with session.lock:
+        if session.decoder is None:
+            session.decoder = FrameDecoder(UPLOAD_MAX_WIDTH)
+        try:
+            data = session.decoder.read(request.stream, request.content_length or 0)
+        except UploadTooLarge:
+            abort(413)
+        img = session.decoder.decode(data)
+        if img is None:
+            abort(400)
+        result = verify_frame(img, session)
+    return jsonify(result)
+
+
+# Route untuk state verifikasi satu sesi dalam format JSON
+@app.route('/verification/<session_id>')
+def verification_state(session_id):
+    state = find_state(session_id)
+    if state is None:
+        abort(404)
+    return jsonify(state)
+
+
+# Route untuk memulai scan baru pada satu sesi atau kamera (pengganti tombol 'R')
+@app.route('/verification/<session_id>/reset', methods=['POST'])
+def reset_verification(session_id):
+    if not known_session(session_id):
+        abort(404)
+    send_command(session_id, reset=True)
+    return jsonify({'status': 'queued'}), 202
+
+
+# Route untuk membaca atau mengubah confidence, verification_threshold, notification_duration
+# dan reset_countdown_duration satu sesi saat runtime, tanpa restart
+@app.route('/verification/<session_id>/config', methods=['GET', 'POST'])
+def verification_config(session_id):
+    if request.method == 'POST':
+        if not known_session(session_id):
+            abort(404)
+        try:
+            settings = parse_settings(request.get_json(silent=True))
+        except ValueError as e:
+            abort(400, str(e))
+        send_command(session_id, settings=settings)
+        return jsonify({'status': 'queued', 'settings': settings}), 202
+    state = find_state(session_id)
+    if state is None:
+        abort(404)
+    return jsonify(state['settings'])
+
+
+# Route untuk statistik latency/throughput inferensi batch
+@app.route('/inference/stats')
+def inference_stats():
+    return jsonify(scheduler.stats())
+
+
+# Route liveness: proses berjalan dan bisa menjawab request
+@app.route('/healthz')
+def healthz():
+    return jsonify(status='ok')
+
+
+# Route readiness: 503 sampai model selesai dimuat dan di-warm-up
+@app.route('/readyz')
+def readyz():
+    model.start()
+    if model.ready:
+        return jsonify(status='ready')
+    if model.error is not None:
+        return jsonify(status='error', error=str(model.error)), 503
+    return jsonify(status='loading'), 503
+
+
+# Route untuk metrik Prometheus (FPS, latency per tahap, frame yang di-drop, hasil verifikasi)
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 # Route untuk halaman utama yang menampilkan video stream di HTML
 @app.route('/')
 def index():
@@ -239,13 +526,19 @@ def index():
         <body>
             <div class="phone-container">
                 <h1>YOLO Spoof Detection Stream</h1>
-                <img src="/video" alt="YOLO Spoof Detection">
+                <img src="/video?w=360" alt="YOLO Spoof Detection">
             </div>
         </body>
     </html>
     '''
 
 
+# Application factory untuk server WSGI: mulai memuat dan warm-up model di background
+def create_app():
+    model.start()
+    return app
+
+
 # Menjalankan Flask app
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
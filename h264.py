@@ -0,0 +1,206 @@
+import asyncio
+import queue
+import shutil
+import struct
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from stream import FrameBroadcaster
+
+FMP4_MIMETYPE = 'video/mp4'
+
+
+def _read_exact(stream, n):
+    data = stream.read(n)
+    return data if len(data) == n else None
+
+
+# Top-level MP4 boxes of a byte stream as (type, bytes), until it ends
+def read_boxes(stream):
+    while True:
+        header = _read_exact(stream, 8)
+        if header is None:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        if size == 1:
+            large = _read_exact(stream, 8)
+            if large is None:
+                return
+            header += large
+            size = struct.unpack('>Q', large)[0]
+        elif size < 8:
+            return  # size 0 runs to the end of the file, never used by fragmented MP4
+        body = _read_exact(stream, size - len(header))
+        if body is None:
+            return
+        yield kind, header + body
+
+
+# One ffmpeg process with the clients watching it: the init segment
+# (ftyp + moov) every client gets first, and a broadcaster of fragments
+class _Encoding:
+    __slots__ = ('process', 'broadcaster', 'init', 'init_ready')
+
+    def __init__(self):
+        self.process = None
+        self.broadcaster = FrameBroadcaster()
+        self.init = None
+        self.init_ready = threading.Event()
+
+
+# Optional H.264 stream of a camera as fragmented MP4, for <video> playback at
+# a fraction of the MJPEG bandwidth. The capture loop hands annotated frames
+# over with submit(), which never blocks: only the newest frame is kept. A
+# writer thread feeds them to a local ffmpeg at a constant fps, repeating the
+# last frame when inference is slower (nearly free in H.264), and a reader
+# thread cuts ffmpeg's output into fragments that start at a keyframe, so a
+# client can join at any fragment. ffmpeg runs while there are clients and
+# stops idle_timeout seconds after the last one left.
+class H264Stream:
+    def __init__(self, fps=15, bitrate='500k', keyframe_interval=1.0, preset='veryfast', ffmpeg='ffmpeg',
+                 idle_timeout=5.0):
+        self.ffmpeg = shutil.which(ffmpeg)
+        if self.ffmpeg is None:
+            raise ValueError(f"{ffmpeg} not found, it is needed for the H.264 stream")
+        self.fps = fps
+        self.bitrate = bitrate
+        self.keyframe_interval = keyframe_interval
+        self.preset = preset
+        self.idle_timeout = idle_timeout
+        self.subscribers = 0
+        self._frames = queue.Queue(1)
+        self._lock = threading.Lock()
+        self._encoding = None
+        self._writer = None
+
+    # True while an encoder runs, so the capture loop only hands over frames then
+    @property
+    def active(self):
+        return self._writer is not None and self._writer.is_alive()
+
+    def submit(self, img):
+        try:
+            self._frames.put_nowait(img)
+        except queue.Full:
+            try:
+                self._frames.get_nowait()  # Replace the frame the writer has not taken yet
+            except queue.Empty:
+                pass
+            try:
+                self._frames.put_nowait(img)
+            except queue.Full:
+                pass
+
+    def _command(self, width, height):
+        return [self.ffmpeg, '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-', '-an',
+                '-c:v', 'libx264', '-preset', self.preset, '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+                '-b:v', self.bitrate, '-g', str(max(1, round(self.fps * self.keyframe_interval))),
+                '-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', '-']
+
+    def _write(self, encoding):
+        try:
+            img = self._frames.get(timeout=self.idle_timeout)
+            h, w = img.shape[:2]
+            process = subprocess.Popen(self._command(w, h), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL)
+        except (queue.Empty, OSError):
+            encoding.broadcaster.close()
+            encoding.init_ready.set()
+            return
+        encoding.process = process
+        threading.Thread(target=self._read, args=(encoding,), name='h264-reader', daemon=True).start()
+        interval = 1 / self.fps
+        next_at = time.monotonic()
+        last_watched = next_at
+        try:
+            while True:
+                try:
+                    img = self._frames.get_nowait()
+                except queue.Empty:
+                    pass
+                if img.shape[:2] != (h, w):
+                    img = cv2.resize(img, (w, h))  # The source changed resolution
+                process.stdin.write(np.ascontiguousarray(img).data)
+                now = time.monotonic()
+                if self.subscribers:
+                    last_watched = now
+                elif now - last_watched > self.idle_timeout:
+                    break
+                next_at = max(next_at + interval, now - interval)
+                time.sleep(max(0.0, next_at - now))
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _read(self, encoding):
+        pending = []
+        try:
+            for kind, box in read_boxes(encoding.process.stdout):
+                pending.append(box)
+                if encoding.init is None:
+                    if kind == b'moov':
+                        encoding.init = b''.join(pending)
+                        pending = []
+                        encoding.init_ready.set()
+                elif kind == b'mdat':
+                    encoding.broadcaster.publish(b''.join(pending))
+                    pending = []
+        finally:
+            encoding.broadcaster.close()
+            encoding.init_ready.set()
+
+    def _start(self):
+        with self._lock:
+            if not self.active:
+                self._encoding = _Encoding()
+                self._writer = threading.Thread(target=self._write, args=(self._encoding,), name='h264-writer',
+                                                daemon=True)
+                self._writer.start()
+            return self._encoding
+
+    # Yields the init segment, then fragments until the encoder stops
+    def subscribe(self):
+        return self._subscribe(self._start())
+
+    def _subscribe(self, encoding):
+        with self._lock:
+            self.subscribers += 1
+        try:
+            encoding.init_ready.wait()
+            if encoding.init is None:
+                return
+            yield encoding.init
+            yield from encoding.broadcaster.subscribe()
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+    # Async counterpart of subscribe() for ASGI servers
+    async def asubscribe(self):
+        encoding = self._start()
+        with self._lock:
+            self.subscribers += 1
+        try:
+            while not encoding.init_ready.is_set():
+                await asyncio.sleep(0.05)  # Only until ffmpeg has written its header
+            if encoding.init is None:
+                return
+            yield encoding.init
+            async for fragment in encoding.broadcaster.asubscribe():
+                yield fragment
+        finally:
+            with self._lock:
+                self.subscribers -= 1
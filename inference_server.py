@@ -0,0 +1,326 @@
+# Inference server shared by several web workers (e.g. gunicorn -w 4).
+#
+# The model is loaded once per inference worker process instead of once per
+# web worker. Each inference worker is pinned to its own CPUs with a matching
+# torch thread count, and batches frames from all web workers together. A web
+# worker (RemoteModel) writes frames into its own shared-memory ring and only
+# sends slot numbers over a local socket; boxes come back the same way.
+#
+# Example:
+#   python inference_server.py --weights ../models/best_204.pt --workers 2
+# and set INFERENCE_SERVER = "127.0.0.1:6000" in flask.py / updatedUI.py.
+import argparse
+import collections
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, Boxes, Results, load_model
+from cameras import SharedFrames
+
+DEFAULT_ADDRESS = '127.0.0.1:6000'
+AUTHKEY_ENV = 'LIVENESS_INFERENCE_KEY'
+
+
+# Shared secret of the server and its clients. multiprocessing.connection
+# unpickles what it receives, so whoever knows the key can run code on the
+# other side: there is no default, nothing starts without one
+def authkey():
+    key = os.environ.get(AUTHKEY_ENV)
+    if not key:
+        raise ValueError(f"Set {AUTHKEY_ENV} to a shared secret for the inference server and its clients")
+    return key.encode()
+
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def _numpy(x):
+    if hasattr(x, 'cpu'):
+        x = x.cpu().numpy()
+    return np.asarray(x)
+
+
+# Split the CPUs this process may use into one set per worker
+def split_cpus(workers):
+    if not hasattr(os, 'sched_getaffinity'):
+        return [None] * workers
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < workers:
+        return [None] * workers
+    size = len(cpus) // workers
+    return [cpus[i * size:(i + 1) * size] for i in range(workers)]
+
+
+def _pin(cpus, backend):
+    cv2.setNumThreads(1)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    if backend == 'torch':
+        try:
+            import torch
+
+            torch.set_num_threads(len(cpus) if cpus else max(1, (os.cpu_count() or 1) // 2))
+        except ImportError:
+            pass
+
+
+# Entry point of an inference worker: takes requests (client, request id,
+# ring name, slot bytes, slots, seqs) from the shared queue, batches up to
+# max_batch frames across clients, and puts (client, request id, boxes or an
+# error message) on the results queue.
+def run_worker(index, options, requests, results):
+    _pin(options['cpus'], options['backend'])
+    try:
+        model = load_model(options['weights'], options['backend'], options['imgsz'])
+        dummy = np.zeros((640, 360, 3), dtype=np.uint8)
+        for _ in range(options['warmup']):
+            model([dummy], verbose=False)
+    except Exception as e:
+        results.put(('error', index, repr(e)))
+        return
+    results.put(('ready', index, None))
+
+    rings = collections.OrderedDict()  # ring name -> SharedFrames, least recently used first
+    while True:
+        batch = [requests.get()]
+        frames = len(batch[0][5])
+        deadline = time.monotonic() + options['max_wait']
+        while frames < options['max_batch']:
+            try:
+                batch.append(requests.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+            frames += len(batch[-1][5])
+
+        imgs, owners = [], []
+        for client, request_id, name, slot_bytes, slots, seqs in batch:
+            ring = rings.pop(name, None) or SharedFrames(slot_bytes, slots, name=name)
+            rings[name] = ring
+            while len(rings) > options['max_clients']:
+                rings.popitem(last=False)[1].close()
+            request_imgs = [ring.read(seq) for seq in seqs]
+            if any(img is None for img in request_imgs):
+                results.put((client, request_id, "frame was overwritten before inference"))
+                continue
+            imgs.extend(request_imgs)
+            owners.append((client, request_id, len(seqs)))
+        if not imgs:
+            continue
+        try:
+            boxes = [(_numpy(r.boxes.xyxy), _numpy(r.boxes.conf), _numpy(r.boxes.cls))
+                     for r in model(imgs, verbose=False)]
+        except Exception as e:
+            for client, request_id, _ in owners:
+                results.put((client, request_id, repr(e)))
+            continue
+        start = 0
+        for client, request_id, n in owners:
+            results.put((client, request_id, boxes[start:start + n]))
+            start += n
+
+
+# Accepts web workers on address and routes their requests to the pool of
+# inference workers, and the results back. Starts listening once at least one
+# worker has loaded its model.
+class InferenceServer:
+    def __init__(self, weights, backend='torch', workers=1, address=DEFAULT_ADDRESS, imgsz=640, warmup=2,
+                 max_batch=8, max_wait=0.005, max_clients=64):
+        self._authkey = authkey()
+        self.address = parse_address(address)
+        self.ready = threading.Event()
+        self._ctx = multiprocessing.get_context('spawn')
+        self._requests = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._errors = []
+        self.workers = []
+        for index, cpus in enumerate(split_cpus(workers)):
+            options = {'weights': weights, 'backend': backend, 'imgsz': imgsz, 'warmup': warmup, 'cpus': cpus,
+                       'max_batch': max_batch, 'max_wait': max_wait, 'max_clients': max_clients}
+            self.workers.append(self._ctx.Process(target=run_worker, name=f'inference-{index}', daemon=True,
+                                                  args=(index, options, self._requests, self._results)))
+
+    def _route(self):
+        while True:
+            client, request_id, payload = self._results.get()
+            if client == 'ready':
+                self.ready.set()
+                continue
+            if client == 'error':
+                self._errors.append(payload)
+                if len(self._errors) == len(self.workers):
+                    self.ready.set()  # Every worker failed, let serve() report it
+                continue
+            with self._lock:
+                conn = self._clients.get(client)
+            if conn is None:
+                continue
+            try:
+                conn.send((request_id, payload))
+            except OSError:
+                pass
+
+    def _serve_client(self, client, conn):
+        try:
+            while True:
+                request_id, name, slot_bytes, slots, seqs = conn.recv()
+                self._requests.put((client, request_id, name, slot_bytes, slots, seqs))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._clients.pop(client, None)
+            conn.close()
+
+    def serve(self):
+        for worker in self.workers:
+            worker.start()
+        threading.Thread(target=self._route, name='inference-router', daemon=True).start()
+        self.ready.wait()
+        if len(self._errors) == len(self.workers):
+            raise RuntimeError(f"No inference worker could load the model: {self._errors[0]}")
+        with Listener(self.address, authkey=self._authkey) as listener:
+            client = 0
+            while True:
+                conn = listener.accept()
+                client += 1
+                with self._lock:
+                    self._clients[client] = conn
+                threading.Thread(target=self._serve_client, args=(client, conn), daemon=True).start()
+
+
+# Drop-in for the model in a web worker (same call interface as LazyModel)
+# that runs inference on an InferenceServer. Frames go through a shared-memory
+# ring of slots frames; larger frames are first scaled down so their longer
+# side is imgsz (the model's own input size) and the boxes scaled back. Calls
+# from several threads are serialized, which InferenceScheduler does anyway.
+class RemoteModel:
+    def __init__(self, address=DEFAULT_ADDRESS, imgsz=640, slots=8, timeout=10.0):
+        self._authkey = authkey()
+        self.address = parse_address(address)
+        self.imgsz = imgsz
+        self.slots = slots
+        self.max_frame_bytes = imgsz * imgsz * 3
+        self.timeout = timeout
+        self.error = None
+        self._conn = None
+        self._frames = None
+        self._seq = 0
+        self._request_id = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self):
+        try:
+            self._conn = Client(self.address, authkey=self._authkey)
+            self.error = None
+        except OSError as e:
+            self.error = e
+        return self._conn is not None
+
+    def _keep_connecting(self):
+        while True:
+            with self._lock:
+                if self._conn is not None or self._connect():
+                    return
+            time.sleep(1.0)
+
+    # Connects in the background, retrying until the server is up
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._keep_connecting, name='inference-client',
+                                                daemon=True)
+                self._thread.start()
+        return self
+
+    # True while connected; the server only listens once a model is loaded
+    @property
+    def ready(self):
+        return self._conn is not None
+
+    def wait(self, timeout=None):
+        self.start()
+        self._thread.join(timeout)
+        return self.ready
+
+    def _disconnect(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _infer(self, imgs):
+        seqs, scales = [], []
+        for img in imgs:
+            h, w = img.shape[:2]
+            scale = min(1.0, self.imgsz / max(h, w))
+            if scale < 1.0:
+                img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                 interpolation=cv2.INTER_AREA)
+            self._seq += 1
+            self._frames.write(self._seq, np.ascontiguousarray(img))
+            seqs.append(self._seq)
+            scales.append(scale)
+        self._request_id += 1
+        self._conn.send((self._request_id, self._frames.name, self.max_frame_bytes, self.slots, seqs))
+        while True:
+            if not self._conn.poll(self.timeout):
+                raise TimeoutError(f"No answer from the inference server at {self.address}")
+            request_id, payload = self._conn.recv()
+            if request_id == self._request_id:
+                break
+        if isinstance(payload, str):
+            raise RuntimeError(f"Inference server failed: {payload}")
+        return [Results(Boxes(xyxy / scale, conf, cls), img.shape[:2])
+                for (xyxy, conf, cls), scale, img in zip(payload, scales, imgs)]
+
+    def __call__(self, imgs, verbose=False, **kwargs):
+        if not isinstance(imgs, (list, tuple)):
+            imgs = [imgs]
+        with self._lock:
+            if self._conn is None and not self._connect():
+                raise RuntimeError(f"Inference server at {self.address} is not reachable") from self.error
+            if self._frames is None:
+                self._frames = SharedFrames(self.max_frame_bytes, self.slots)
+            results = []
+            try:
+                for i in range(0, len(imgs), self.slots):
+                    results.extend(self._infer(imgs[i:i + self.slots]))
+            except (EOFError, OSError, TimeoutError) as e:
+                self.error = e
+                self._disconnect()  # Reconnect on the next call
+                raise
+            return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference server shared by several web workers")
+    parser.add_argument('--weights', default="../models/best_204.pt")
+    parser.add_argument('--backend', default='torch', choices=BACKENDS)
+    parser.add_argument('--workers', type=int, default=1, help="inference processes, each with its own CPUs")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help="host:port to listen on")
+    parser.add_argument('--max-batch', type=int, default=8, help="max frames per model call")
+    parser.add_argument('--max-wait', type=float, default=0.005, help="seconds to wait for a fuller batch")
+    args = parser.parse_args(argv)
+
+    try:
+        server = InferenceServer(args.weights, args.backend, args.workers, args.address,
+                                 max_batch=args.max_batch, max_wait=args.max_wait)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Inference server on {args.address} with {args.workers} worker(s)")
+    server.serve()
+
+
+if __name__ == '__main__':
+    main()
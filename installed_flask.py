@@ -0,0 +1,19 @@
+# The repo's own flask.py shadows the installed Flask whenever this directory
+# is on sys.path: under uvicorn or gunicorn started from here, and in spawned
+# camera processes, which re-import the app to unpickle frame_processor.
+# Importing this module first loads the installed package, so a later
+# `from flask import Flask` in flask.py or updatedUI.py resolves to it.
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+if 'flask' not in sys.modules:
+    _path = list(sys.path)
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or '.') != _ROOT]
+    try:
+        import flask  # noqa: F401
+    except ImportError:
+        pass  # Flask is not installed; importing an app reports it
+    finally:
+        sys.path[:] = _path
@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labelnames, values)) + '}'
+
+
+# Small Prometheus-style metrics without extra dependencies. Updating a metric
+# is a lock + a few additions, so it is cheap enough for the frame loop; the
+# text exposition is only built when /metrics is scraped.
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, _format_labels(self.labelnames, values)))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labels):
+        return [f'{name}{labels} {self.value}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    _new_child = _CounterChild
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ('function',)
+
+    def __init__(self):
+        super().__init__()
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self, name, labels):
+        value = self.function() if self.function is not None else self.value
+        return [f'{name}{labels} {value}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+    _new_child = _GaugeChild
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def render(self, name, labels):
+        inner = labels[1:-1] + ',' if labels else ''
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{inner}le="{le}"}} {total}')
+        lines.append(f'{name}_sum{labels} {self.sum}')
+        lines.append(f'{name}_count{labels} {total}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# Frame rate of a loop, published to a gauge about once per second instead of
+# being printed every frame
+class FpsMeter:
+    __slots__ = ('gauge', 'interval', '_frames', '_since')
+
+    def __init__(self, gauge, interval=1.0):
+        self.gauge = gauge
+        self.interval = interval
+        self._frames = 0
+        self._since = time.monotonic()
+
+    def tick(self):
+        self._frames += 1
+        now = time.monotonic()
+        elapsed = now - self._since
+        if elapsed >= self.interval:
+            self.gauge.set(self._frames / elapsed)
+            self._frames = 0
+            self._since = now
+
+
+FRAMES = Counter('liveness_frames_total', 'Frames processed per stream', ['stream'])
+FRAMES_DROPPED = Counter('liveness_frames_dropped_total', 'Frames dropped before reaching a client', ['reason'])
+STREAM_FPS = Gauge('liveness_stream_fps', 'Processing frame rate per stream', ['stream'])
+STAGE_SECONDS = Histogram('liveness_stage_seconds', 'Time spent per pipeline stage', ['stage'])
+INFERENCE_SECONDS = Histogram('liveness_inference_batch_seconds', 'Model latency per batched call')
+INFERENCE_BATCH_SIZE = Histogram('liveness_inference_batch_size', 'Frames per batched model call',
+                                 buckets=(1, 2, 4, 8, 16, 32, 64))
+TIER_DOWNGRADES = Counter('liveness_stream_tier_downgrades_total',
+                          'Video clients moved to a lower tier after falling behind')
+RESULT_CACHE = Counter('liveness_result_cache_total', 'Result cache lookups for similar frames', ['result'])
+EVIDENCE_CLIPS = Counter('liveness_evidence_clips_total', 'Evidence clips by outcome', ['result'])
+VERIFICATIONS = Counter('liveness_verifications_total', 'Completed verifications by result', ['result'])
+ACTIVE_SESSIONS = Gauge('liveness_active_sessions', 'Verification sessions currently tracked')
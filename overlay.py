@@ -0,0 +1,95 @@
+import functools
+
+import cv2
+import cvzone
+import numpy as np
+
+WHITE = (255, 255, 255)
+
+
+# Pre-rendered piece of overlay: BGR pixels plus a mask of the pixels that were
+# drawn. Pasting copies only those pixels, clipped to the frame, so a cached
+# sprite costs one masked copy instead of re-rasterizing text every frame.
+class Sprite:
+    __slots__ = ('image', 'mask', 'anchor')
+
+    def __init__(self, image, mask, anchor):
+        self.image = image
+        self.mask = mask
+        self.anchor = anchor
+
+    # Draw the sprite with its anchor at pos, like the pos of cv2.putText
+    def paste(self, img, pos):
+        x, y = pos[0] - self.anchor[0], pos[1] - self.anchor[1]
+        h, w = self.image.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, img.shape[1]), min(y + h, img.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        src = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        cv2.copyTo(self.image[src], self.mask[src], img[y0:y1, x0:x1])
+
+
+def _canvas(width, height):
+    return np.zeros((height, width, 3), dtype=np.uint8), np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def _sprite(image, mask, anchor):
+    mask = np.ascontiguousarray(mask[:, :, 0])
+    image.flags.writeable = False
+    mask.flags.writeable = False
+    return Sprite(image, mask, anchor)
+
+
+# Cached equivalent of cvzone.putTextRect(img, text, pos, ...); paste at pos
+@functools.lru_cache(maxsize=512)
+def text_rect(text, scale=3, thickness=3, colorT=WHITE, colorR=(255, 0, 255),
+              font=cv2.FONT_HERSHEY_PLAIN, offset=10, border=None, colorB=(0, 255, 0)):
+    (w, h), baseline = cv2.getTextSize(text, font, scale, thickness)
+    pad = offset + (border or 0) + thickness
+    anchor = (pad, h + pad)
+    image, mask = _canvas(w + 2 * pad, h + baseline + 2 * pad)
+    cvzone.putTextRect(image, text, anchor, scale, thickness, colorT, colorR, font, offset, border, colorB)
+    cvzone.putTextRect(mask, text, anchor, scale, thickness, WHITE, WHITE, font, offset, border, WHITE)
+    return _sprite(image, mask, anchor)
+
+
+# Cached cv2.putText, optionally over a thicker shadow pass; paste at the text origin
+@functools.lru_cache(maxsize=256)
+def shadowed_text(text, scale, color, thickness, shadow=None, shadow_thickness=None, font=cv2.FONT_HERSHEY_SIMPLEX):
+    outer = max(thickness, shadow_thickness or 0)
+    (w, h), baseline = cv2.getTextSize(text, font, scale, outer)
+    anchor = (outer, h + outer)
+    image, mask = _canvas(w + 2 * outer, h + baseline + 2 * outer)
+    for c, t in ((shadow, shadow_thickness), (color, thickness)):
+        if c is not None:
+            cv2.putText(image, text, anchor, font, scale, c, t)
+            cv2.putText(mask, text, anchor, font, scale, WHITE, t)
+    return _sprite(image, mask, anchor)
+
+
+@functools.lru_cache(maxsize=16)
+def _solid(shape, color):
+    solid = np.full(shape, color, dtype=np.uint8)
+    solid.flags.writeable = False
+    return solid
+
+
+# Alpha-blend a solid color over rows y0..y1 only, instead of blending a
+# copy of the whole frame
+def blend_band(img, y0, y1, color, alpha):
+    y0, y1 = max(0, y0), min(img.shape[0], y1)
+    if y0 >= y1:
+        return
+    roi = img[y0:y1]
+    cv2.addWeighted(_solid(roi.shape, color), alpha, roi, 1 - alpha, 0, roi)
+
+
+# (grow, color, thickness) of nested rectangles fading from inner to outer color
+def gradient_rings(inner, outer, steps=5):
+    rings = []
+    for i in range(steps):
+        alpha = i / steps
+        color = tuple(int(a * (1 - alpha) + b * alpha) for a, b in zip(inner, outer))
+        rings.append((i * 2, color, max(1, steps - i)))
+    return tuple(rings)
@@ -0,0 +1,44 @@
+import numpy as np
+
+EMPTY = np.zeros((0, 6), dtype=np.float64)
+
+
+def _numpy(x):
+    # torch tensors (possibly on the GPU) or plain arrays from the exported backends
+    if hasattr(x, 'cpu'):
+        x = x.cpu().numpy()
+    return np.asarray(x)
+
+
+# Post-process all boxes of one Results at once: one host copy per attribute
+# instead of several tensor ops per box. Returns an (N, 6) array of
+# x1, y1, x2, y2, conf, cls for boxes above the confidence threshold, in model
+# order. Coordinates are truncated to whole pixels and confidences rounded up
+# to two decimals, like the per-box code did.
+def box_array(r, confidence):
+    boxes = r.boxes
+    if boxes is None or not len(boxes):
+        return EMPTY
+    conf = np.ceil(_numpy(boxes.conf).astype(np.float32) * np.float32(100)).astype(np.float64) / 100
+    keep = conf > confidence
+    if not keep.any():
+        return EMPTY
+    out = np.empty((int(keep.sum()), 6), dtype=np.float64)
+    out[:, :4] = np.trunc(_numpy(boxes.xyxy)[keep])
+    out[:, 4] = conf[keep]
+    out[:, 5] = _numpy(boxes.cls)[keep]
+    return out
+
+
+# (x1, y1, x2, y2, conf, cls) tuples with int pixels and class, as the drawing,
+# tracking and JSON code expect; converted column-wise in one go
+def to_detections(dets):
+    if not len(dets):
+        return []
+    coords = dets[:, :4].astype(np.int64).tolist()
+    return [(x1, y1, x2, y2, conf, cls) for (x1, y1, x2, y2), conf, cls
+            in zip(coords, dets[:, 4].tolist(), dets[:, 5].astype(np.int64).tolist())]
+
+
+def extract_detections(r, confidence):
+    return to_detections(box_array(r, confidence))
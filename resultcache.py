@@ -0,0 +1,48 @@
+import time
+
+import cv2
+
+from metrics import RESULT_CACHE
+
+_hits = RESULT_CACHE.labels('hit')
+_misses = RESULT_CACHE.labels('miss')
+
+
+# Per-session cache of the last model detections, keyed on a tiny grayscale
+# thumbnail of the frame they came from. A new frame whose mean absolute
+# difference to that thumbnail is within tolerance (0-255 scale) reuses the
+# detections, for at most max_age seconds after the inference that produced
+# them. Comparing against the inferred frame rather than the previous one
+# means slow drift still adds up to a fresh inference.
+class ResultCache:
+    __slots__ = ('tolerance', 'max_age', 'size', 'hits', 'misses', '_thumb', '_detections', '_stored_at')
+
+    def __init__(self, tolerance=3.0, max_age=1.0, size=(32, 32)):
+        self.tolerance = tolerance
+        self.max_age = max_age
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._thumb = None
+        self._detections = None
+        self._stored_at = None
+
+    def fingerprint(self, img):
+        return cv2.cvtColor(cv2.resize(img, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+    # Cached detections for a frame with this fingerprint, or None on a miss
+    def lookup(self, thumb, now=None):
+        now = time.monotonic() if now is None else now
+        if (self._thumb is not None and now - self._stored_at <= self.max_age
+                and cv2.absdiff(thumb, self._thumb).mean() <= self.tolerance):
+            self.hits += 1
+            _hits.inc()
+            return self._detections
+        self.misses += 1
+        _misses.inc()
+        return None
+
+    def store(self, thumb, detections, now=None):
+        self._thumb = thumb
+        self._detections = detections
+        self._stored_at = time.monotonic() if now is None else now
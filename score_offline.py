@@ -0,0 +1,235 @@
+# Offline batch scoring of recorded attempts with the fake/real classifier.
+#
+# Every input is a clip: a video file or a directory of images (a directory of
+# videos / image folders is expanded one level). Clips are spread over worker
+# processes; each worker prefetches frames on a reader thread into a bounded
+# queue and runs batched inference. Per-frame and per-clip verdicts use the
+# same confidence threshold and verification state machine as the live apps,
+# driven by media timestamps instead of the wall clock.
+#
+# Example:
+#   python score_offline.py recordings/ --weights ../models/best_204.pt \
+#       --frames-out frames.csv --clips-out clips.parquet --workers 4
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import threading
+
+import cv2
+
+from backends import BACKENDS, load_model
+from postprocess import box_array
+from session import VerificationSession
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+classNames = ["fake", "real"]
+
+FRAME_FIELDS = ['clip', 'frame', 'timestamp', 'detection', 'confidence', 'num_boxes']
+CLIP_FIELDS = ['clip', 'frames', 'real_frames', 'fake_frames', 'empty_frames', 'verdict', 'decided_at']
+
+
+def _images_in(path):
+    return sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def find_clips(paths):
+    clips = []
+    for path in paths:
+        if os.path.isfile(path):
+            clips.append(path)
+        elif _images_in(path):
+            clips.append(path)
+        else:
+            for name in sorted(os.listdir(path)):
+                child = os.path.join(path, name)
+                if os.path.isdir(child) and _images_in(child):
+                    clips.append(child)
+                elif child.lower().endswith(VIDEO_EXTENSIONS):
+                    clips.append(child)
+    return clips
+
+
+# Yields (frame index, timestamp in seconds, BGR image) for one clip
+def read_frames(clip, image_fps):
+    if os.path.isdir(clip):
+        for i, path in enumerate(_images_in(clip)):
+            img = cv2.imread(path)
+            if img is not None:
+                yield i, i / image_fps, img
+        return
+    cap = cv2.VideoCapture(clip)
+    fps = cap.get(cv2.CAP_PROP_FPS) or image_fps
+    i = 0
+    try:
+        while True:
+            success, img = cap.read()
+            if not success:
+                break
+            yield i, i / fps, img
+            i += 1
+    finally:
+        cap.release()
+
+
+# Reader thread that keeps at most `prefetch` decoded frames ahead of inference
+def prefetch_frames(clip, image_fps, prefetch):
+    frames = queue.Queue(maxsize=prefetch)
+    done = object()
+
+    def reader():
+        try:
+            for item in read_frames(clip, image_fps):
+                frames.put(item)
+        finally:
+            frames.put(done)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        item = frames.get()
+        if item is done:
+            return
+        yield item
+
+
+def _batches(frames, batch_size):
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_model = None
+_options = None
+
+
+def _init_worker(options):
+    global _model, _options
+    _options = options
+    cv2.setNumThreads(1)
+    if options['torch_threads']:
+        try:
+            import torch
+
+            torch.set_num_threads(options['torch_threads'])
+        except ImportError:
+            pass
+    _model = load_model(options['weights'], options['backend'])
+
+
+def score_clip(clip):
+    options = _options
+    session = VerificationSession(clip, verification_threshold=options['verification_threshold'],
+                                  decide_score=options['early_decision_score'],
+                                  min_evidence=options['early_decision_seconds'])
+    frame_rows = []
+    counts = {'real': 0, 'fake': 0, None: 0}
+    verdict, decided_at = None, None
+
+    frames = prefetch_frames(clip, options['image_fps'], options['prefetch'])
+    for batch in _batches(frames, options['batch_size']):
+        results = _model([img for _, _, img in batch], verbose=False)
+        for (index, timestamp, _), r in zip(batch, results):
+            detections = box_array(r, options['confidence'])
+            detection = classNames[int(detections[-1, 5])] if len(detections) else None
+            confidence = float(detections[-1, 4]) if len(detections) else None
+            counts[detection] += 1
+            frame_rows.append({
+                'clip': clip, 'frame': index, 'timestamp': round(timestamp, 3), 'detection': detection,
+                'confidence': confidence, 'num_boxes': len(detections),
+            })
+            if verdict is None:
+                session.update(detection, now=timestamp, confidence=confidence)
+                if session.verification_status:
+                    verdict, decided_at = session.verification_status, round(timestamp, 3)
+
+    clip_row = {
+        'clip': clip, 'frames': len(frame_rows), 'real_frames': counts['real'], 'fake_frames': counts['fake'],
+        'empty_frames': counts[None], 'verdict': verdict or 'UNDECIDED', 'decided_at': decided_at,
+    }
+    return frame_rows, clip_row
+
+
+# CSV rows are streamed as clips finish; Parquet is written once at the end
+class RowWriter:
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+        self.parquet = path is not None and path.endswith('.parquet')
+        self.rows = []
+        self._file = None
+        self._csv = None
+        if path is not None and not self.parquet:
+            self._file = open(path, 'w', newline='')
+            self._csv = csv.DictWriter(self._file, fieldnames=fields)
+            self._csv.writeheader()
+
+    def write(self, rows):
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        elif self.parquet:
+            self.rows.extend(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif self.parquet:
+            import pandas as pd
+
+            pd.DataFrame(self.rows, columns=self.fields).to_parquet(self.path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score recorded videos / image folders with the anti-spoofing model")
+    parser.add_argument('inputs', nargs='+', help="video files, image directories or directories of clips")
+    parser.add_argument('--weights', default="../models/best_204.pt")
+    parser.add_argument('--backend', default='torch', choices=BACKENDS)
+    parser.add_argument('--frames-out', help="per-frame results (.csv or .parquet)")
+    parser.add_argument('--clips-out', default='clips.csv', help="per-clip verdicts (.csv or .parquet)")
+    parser.add_argument('--confidence', type=float, default=0.6)
+    parser.add_argument('--verification-threshold', type=float, default=10,
+                        help="seconds of consistent detection needed for a verdict")
+    parser.add_argument('--early-decision-score', type=float, default=0.85,
+                        help="aggregated confidence that allows an earlier verdict (negative disables)")
+    parser.add_argument('--early-decision-seconds', type=float, default=3,
+                        help="seconds the aggregated confidence has to hold for an early verdict")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--prefetch', type=int, default=64, help="max decoded frames buffered per worker")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--image-fps', type=float, default=30, help="frame rate assumed for image directories")
+    args = parser.parse_args(argv)
+
+    clips = find_clips(args.inputs)
+    if not clips:
+        parser.error("no clips found")
+
+    options = {
+        'weights': args.weights, 'backend': args.backend, 'confidence': args.confidence,
+        'verification_threshold': args.verification_threshold, 'batch_size': args.batch_size,
+        'early_decision_score': args.early_decision_score if args.early_decision_score >= 0 else None,
+        'early_decision_seconds': args.early_decision_seconds,
+        'prefetch': args.prefetch, 'image_fps': args.image_fps,
+        'torch_threads': max(1, (os.cpu_count() or 1) // args.workers),
+    }
+    frames_out = RowWriter(args.frames_out, FRAME_FIELDS)
+    clips_out = RowWriter(args.clips_out, CLIP_FIELDS)
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        with ctx.Pool(args.workers, initializer=_init_worker, initargs=(options,)) as pool:
+            for done, (frame_rows, clip_row) in enumerate(pool.imap_unordered(score_clip, clips), 1):
+                frames_out.write(frame_rows)
+                clips_out.write([clip_row])
+                print(f"[{done}/{len(clips)}] {clip_row['clip']}: {clip_row['verdict']}")
+    finally:
+        frames_out.close()
+        clips_out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import collections
+import math
+import threading
+import time
+
+CONFIDENCE = 0.6  # Minimum detection confidence
+RESET_COUNTDOWN_DURATION = 3  # Duration of reset countdown in seconds
+NOTIFICATION_DURATION = 3  # Duration of notification in seconds
+VERIFICATION_THRESHOLD = 10  # Time required for verification in seconds
+NO_FACE_TIMEOUT = 2  # Reset after this many seconds without a detection
+DECIDE_SCORE = 0.85  # Aggregated score (0-1) that allows a verdict before VERIFICATION_THRESHOLD
+MIN_EVIDENCE = 3  # Seconds the score has to stay above DECIDE_SCORE for an early verdict
+
+
+# Streaming aggregate of per-frame evidence: +confidence for 'real' and
+# -confidence for 'fake', smoothed by an EMA with time constant tau seconds
+# (so it behaves the same at any frame rate). The label only flips when the
+# score crosses the opposite +/-hysteresis, so one flickering frame does not
+# restart a verification. decisive() is True once the score has stayed beyond
+# decide_score for min_evidence seconds; decide_score=None disables that.
+# supports(label) is True while the score is beyond hysteresis on that side:
+# the label alone can lag behind, e.g. when the classes keep alternating.
+class ScoreAggregator:
+    __slots__ = ('tau', 'hysteresis', 'decide_score', 'min_evidence', 'score', 'label',
+                 '_updated_at', '_decisive_since')
+
+    def __init__(self, tau=1.0, hysteresis=0.2, decide_score=DECIDE_SCORE, min_evidence=MIN_EVIDENCE):
+        self.tau = tau
+        self.hysteresis = hysteresis
+        self.decide_score = decide_score
+        self.min_evidence = min_evidence
+        self.reset()
+
+    def reset(self):
+        self.score = 0.0
+        self.label = None
+        self._updated_at = None
+        self._decisive_since = None
+
+    # Add one frame's detection ('real' or 'fake'); returns the aggregated label
+    def update(self, detection, confidence, now):
+        x = 1.0 if confidence is None else confidence
+        if detection != 'real':
+            x = -x
+        if self._updated_at is None:
+            self.score = x
+        else:
+            alpha = 1 - math.exp(-max(0.0, now - self._updated_at) / self.tau)
+            self.score += alpha * (x - self.score)
+        self._updated_at = now
+
+        if self.score >= self.hysteresis:
+            self.label = 'real'
+        elif self.score <= -self.hysteresis:
+            self.label = 'fake'
+
+        if self.decide_score is not None and abs(self.score) >= self.decide_score:
+            if self._decisive_since is None:
+                self._decisive_since = now
+        else:
+            self._decisive_since = None
+        return self.label
+
+    def decisive(self, now):
+        return self._decisive_since is not None and now - self._decisive_since >= self.min_evidence
+
+    def supports(self, label):
+        if label == 'real':
+            return self.score >= self.hysteresis
+        return label == 'fake' and self.score <= -self.hysteresis
+
+
+# Settings that can be changed per session at runtime, with their valid range
+SETTINGS = {
+    'confidence': lambda v: 0 <= v <= 1,
+    'verification_threshold': lambda v: v > 0,
+    'notification_duration': lambda v: v >= 0,
+    'reset_countdown_duration': lambda v: v >= 0,
+}
+
+
+# Validated settings update from a request body; raises ValueError for
+# unknown names and out-of-range or non-numeric values
+def parse_settings(data):
+    if not isinstance(data, dict):
+        raise ValueError("settings must be a JSON object")
+    for name, value in data.items():
+        check = SETTINGS.get(name)
+        if check is None:
+            raise ValueError(f"unknown setting {name!r}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not check(value):
+            raise ValueError(f"invalid value for {name}: {value!r}")
+    return dict(data)
+
+
+# States of a verification session
+IDLE = 'idle'  # Waiting for a face
+VERIFYING = 'verifying'  # The same class keeps being detected, timer running
+RESULT = 'result'  # Verdict shown for notification_duration
+RESETTING = 'resetting'  # Countdown before the next scan
+
+
+# Verification state machine for a single stream (camera or remote client).
+# Every stream owns one of these, so one user's scan never resets another's.
+# All timing is measured on `clock` (monotonic by default) rather than counted
+# in frames, so it behaves the same at 8 or 30 FPS and when frames are dropped.
+# Pass a fake clock, or `now` explicitly, to drive it deterministically.
+class VerificationSession:
+    __slots__ = ('session_id', 'clock', 'state', 'state_since', 'current_detection',
+                 'detect_start_time', 'verification_timer', 'last_detection_time',
+                 'verification_status', 'reset_countdown', 'last_seen', 'verification_threshold',
+                 'notification_duration', 'reset_countdown_duration', 'aggregator', 'cadence', 'result_cache',
+                 'decoder', 'evidence', 'confidence', 'lock', '_requests')
+
+    def __init__(self, session_id, verification_threshold=VERIFICATION_THRESHOLD,
+                 notification_duration=NOTIFICATION_DURATION,
+                 reset_countdown_duration=RESET_COUNTDOWN_DURATION, clock=time.monotonic,
+                 decide_score=DECIDE_SCORE, min_evidence=MIN_EVIDENCE, confidence=CONFIDENCE):
+        self.session_id = session_id
+        self.confidence = confidence
+        self.verification_threshold = verification_threshold
+        self.notification_duration = notification_duration
+        self.reset_countdown_duration = reset_countdown_duration
+        self.clock = clock
+        self.aggregator = ScoreAggregator(decide_score=decide_score, min_evidence=min_evidence)
+        self.state = IDLE
+        self.state_since = clock()
+        self.current_detection = None
+        self.detect_start_time = None
+        self.verification_timer = 0
+        self.last_detection_time = None
+        self.verification_status = None
+        self.reset_countdown = 0
+        self.last_seen = time.monotonic()
+        self.cadence = None  # Per-stream inference cadence/tracker, attached by the app
+        self.result_cache = None  # Detections reused for near-identical frames, attached by the app
+        self.decoder = None  # Reused upload buffer for client-sent frames, attached by the app
+        self.evidence = None  # Pre-roll frames for the evidence recorder, attached by the app
+        self.lock = threading.Lock()  # Serializes frames of one session sent by concurrent requests
+        self._requests = collections.deque()  # (reset, settings) queued by request()
+
+    def _enter(self, state, now):
+        self.state = state
+        self.state_since = now
+
+    def reset_verification(self, now=None):
+        now = self.clock() if now is None else now
+        self.current_detection = None
+        self.detect_start_time = None
+        self.verification_timer = 0
+        self.last_detection_time = None
+        self.verification_status = None
+        self.aggregator.reset()
+        self.reset_countdown = self.reset_countdown_duration
+        self._enter(RESETTING, now)
+
+    # Queue a reset and/or a settings change from another thread, e.g. an HTTP
+    # request. Nothing changes until the frame loop calls apply_requests()
+    def request(self, reset=False, settings=None):
+        self._requests.append((reset, settings or {}))
+
+    # Apply queued requests between two frames, each one as a whole
+    def apply_requests(self, now=None):
+        while self._requests:
+            reset, settings = self._requests.popleft()
+            for name, value in settings.items():
+                setattr(self, name, value)
+            if reset:
+                self.reset_verification(now)
+
+    def settings(self):
+        return {name: getattr(self, name) for name in SETTINGS}
+
+    def start_new_verification(self, now=None):
+        self.reset_countdown = 0
+        self._enter(IDLE, self.clock() if now is None else now)
+
+    # Advance the reset countdown by the time elapsed since the reset started
+    def tick_reset(self, now=None):
+        if self.state != RESETTING:
+            return
+        now = self.clock() if now is None else now
+        self.reset_countdown = max(0, self.reset_countdown_duration - (now - self.state_since))
+        if self.reset_countdown <= 0:
+            self.start_new_verification(now)
+
+    @property
+    def is_resetting(self):
+        return self.state == RESETTING
+
+    @property
+    def is_verifying(self):
+        return self.state == VERIFYING
+
+    @property
+    def show_notification(self):
+        return self.state == RESULT
+
+    def to_dict(self):
+        countdown = None
+        if self.is_verifying:
+            countdown = max(0, self.verification_threshold - int(self.verification_timer))
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'detection': self.current_detection,
+            'score': round(self.aggregator.score, 3),
+            'verification_timer': self.verification_timer,
+            'countdown': countdown,
+            'verification_status': self.verification_status,
+            'is_resetting': self.is_resetting,
+            'reset_countdown': max(0, int(self.reset_countdown)),
+            'settings': self.settings(),
+        }
+
+    # Feed the detection of the current frame ('real', 'fake' or None) and its
+    # confidence. The timer runs while the score backs the aggregated label and
+    # restarts when the label flips or the score falls back inside the
+    # hysteresis band, so classes that keep alternating never reach a verdict.
+    # A verdict comes after verification_threshold seconds or as soon as the
+    # evidence is decisive. now defaults to the session clock; offline scoring
+    # passes media timestamps. Returns the verdict when this frame completed
+    # a verification, else None
+    def update(self, current_frame_detection, now=None, confidence=None):
+        now = self.clock() if now is None else now
+        if self.state == RESETTING:
+            self.tick_reset(now)
+            return None
+        if self.state == RESULT:
+            if now - self.state_since >= self.notification_duration:
+                self.reset_verification(now)  # Auto-reset after notification duration
+            return None
+
+        if current_frame_detection:
+            self.last_detection_time = now
+            label = self.aggregator.update(current_frame_detection, confidence, now)
+            if self.current_detection != label or not self.aggregator.supports(label):
+                self.current_detection = label
+                self.detect_start_time = now
+                self.verification_timer = 0
+                self._enter(VERIFYING, now)
+            else:
+                self.verification_timer = now - self.detect_start_time
+                if self.verification_timer >= self.verification_threshold or self.aggregator.decisive(now):
+                    self.verification_status = "SUCCESS" if self.current_detection == "real" else "FAILED"
+                    self._enter(RESULT, now)
+                    return self.verification_status
+        elif self.state == VERIFYING and now - self.last_detection_time > NO_FACE_TIMEOUT:
+            self.reset_verification(now)
+        return None
+
+
+# Thread-safe map of session id -> VerificationSession that drops idle sessions.
+# The lock only guards the dict; each session is driven by its own stream.
+class SessionRegistry:
+    def __init__(self, idle_timeout=300, **session_settings):
+        self.idle_timeout = idle_timeout
+        self.session_settings = session_settings
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = VerificationSession(session_id, **self.session_settings)
+                self._sessions[session_id] = session
+            session.last_seen = now
+            if now - self._last_eviction > self.idle_timeout / 10:
+                self._evict_idle(now)
+        return session
+
+    def find(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _evict_idle(self, now):
+        self._last_eviction = now
+        idle = [sid for sid, s in self._sessions.items() if now - s.last_seen > self.idle_timeout]
+        for sid in idle:
+            del self._sessions[sid]
+        return idle
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions.values()))
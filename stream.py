@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+
+from encoding import EncoderPool, JpegEncoder, Tier
+from metrics import FRAMES_DROPPED, STAGE_SECONDS, TIER_DOWNGRADES
+
+_capture_seconds = STAGE_SECONDS.labels('capture')
+_slow_client_drops = FRAMES_DROPPED.labels('slow_client')
+
+MJPEG_MIMETYPE = 'multipart/x-mixed-replace; boundary=frame'
+
+
+# Wrap one JPEG into a multipart/x-mixed-replace part
+def mjpeg_part(jpeg):
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n\r\n'
+
+
+# Tells when a client's socket writes back up: over every window of frames
+# published while it was subscribed, more than max_skipped of them had to be
+# skipped because the client was still busy with an older one.
+class Backpressure:
+    __slots__ = ('window', 'max_skipped', 'frames', 'skipped')
+
+    def __init__(self, window=30, max_skipped=0.5):
+        self.window = window
+        self.max_skipped = max_skipped
+        self.frames = 0
+        self.skipped = 0
+
+    # Count one delivered frame and the frames skipped before it; True when behind
+    def frame(self, skipped):
+        self.frames += 1 + skipped
+        self.skipped += skipped
+        if self.frames < self.window:
+            return False
+        behind = self.skipped > self.max_skipped * self.frames
+        self.frames = self.skipped = 0
+        return behind
+
+
+# Broadcast buffer that only keeps the latest frame.
+# Subscribers that fall behind skip straight to the newest frame instead of
+# queueing old ones, so a slow client never stalls the producer or other clients.
+class FrameBroadcaster:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._closed = False
+        self._async_waiters = {}  # event loop -> set of asyncio.Event
+        self.subscribers = 0
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, frame):
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self._cond.notify_all()
+            self._notify_async()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._notify_async()
+
+    # One call_soon_threadsafe per event loop, however many async subscribers it has
+    def _notify_async(self):
+        for loop, events in self._async_waiters.items():
+            loop.call_soon_threadsafe(_set_all, list(events))
+
+    # Wait for a frame newer than last_seq, returns (seq, frame).
+    # frame is None on timeout or when the producer has stopped.
+    def wait(self, last_seq, timeout=1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or self._closed, timeout)
+            if self._seq == last_seq:
+                return last_seq, None
+            return self._seq, self._frame
+
+    # Yields frames until the producer stops, or until backpressure reports
+    # that this client has fallen behind
+    def subscribe(self, backpressure=None):
+        with self._cond:
+            self.subscribers += 1
+        seq = 0
+        try:
+            while True:
+                last_seq = seq
+                seq, frame = self.wait(seq)
+                if frame is None:
+                    if self._closed:
+                        return
+                    continue
+                skipped = seq - last_seq - 1 if last_seq else 0
+                if skipped > 0:
+                    _slow_client_drops.inc(skipped)
+                if backpressure is not None and backpressure.frame(skipped):
+                    return
+                yield frame
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    # Async counterpart of subscribe() for ASGI servers; never blocks the event loop
+    async def asubscribe(self, backpressure=None):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        with self._cond:
+            self._async_waiters.setdefault(loop, set()).add(event)
+            self.subscribers += 1
+        seq = 0
+        try:
+            while True:
+                with self._cond:
+                    frame = None
+                    skipped = 0
+                    if self._seq != seq:
+                        if seq and self._seq - seq > 1:
+                            skipped = self._seq - seq - 1
+                            _slow_client_drops.inc(skipped)
+                        seq, frame = self._seq, self._frame
+                    elif self._closed:
+                        return
+                if frame is None:
+                    await event.wait()
+                    event.clear()
+                    continue
+                if backpressure is not None and backpressure.frame(skipped):
+                    return
+                yield frame
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                events = self._async_waiters.get(loop)
+                events.discard(event)
+                if not events:
+                    del self._async_waiters[loop]
+
+
+def _set_all(events):
+    for event in events:
+        event.set()
+
+
+# Single background producer: reads the camera and runs process(img), which
+# returns the annotated frame or None to stop the stream. Encoding happens on
+# the encoder pool, so it never adds to the capture/inference loop. Only the
+# tiers that currently have subscribers are encoded. Active sinks (e.g. an
+# H264Stream) get every annotated frame through their non-blocking submit().
+class CaptureWorker(threading.Thread):
+    def __init__(self, cap, process, broadcasters, encoder_pool, sinks=()):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.process = process
+        self.broadcasters = broadcasters  # tier -> FrameBroadcaster
+        self.encoder_pool = encoder_pool
+        self.sinks = sinks
+
+    def _publish(self, jpegs):
+        for tier, jpeg in jpegs.items():
+            self.broadcasters[tier].publish(mjpeg_part(jpeg))
+
+    def run(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                success, img = self.cap.read()
+                if not success:
+                    break
+                _capture_seconds.observe(time.perf_counter() - start)
+                img = self.process(img)
+                if img is None:
+                    break
+                tiers = [tier for tier, broadcaster in self.broadcasters.items() if broadcaster.subscribers]
+                if tiers:
+                    self.encoder_pool.submit(img, self._publish, tiers)
+                for sink in self.sinks:
+                    if sink.active:
+                        sink.submit(img)
+        finally:
+            for broadcaster in self.broadcasters.values():
+                broadcaster.close()
+
+
+# Owns one capture worker per camera and hands out subscriptions to it.
+# The worker is started by the first subscriber and restarted after it stops.
+#
+# tiers are the (width, quality) variants clients can pick, best first; each
+# one is resized and encoded once per frame however many clients use it. An
+# adaptive subscriber moves down one tier whenever it falls behind.
+class StreamHub:
+    def __init__(self, cap, process, encoder_pool=None, tiers=None, backpressure_window=30, max_skipped=0.5):
+        self.cap = cap
+        self.process = process
+        self.encoder_pool = encoder_pool or EncoderPool(JpegEncoder())
+        self.tiers = tuple(Tier(*tier) for tier in tiers) if tiers else (Tier(None, None),)
+        self.backpressure_window = backpressure_window
+        self.max_skipped = max_skipped
+        self._lock = threading.Lock()
+        self._worker = None
+        self.broadcasters = {}
+        self.broadcaster = None  # Broadcaster of the best tier
+        self.sinks = []
+
+    def ensure_started(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self.broadcasters = {tier: FrameBroadcaster() for tier in self.tiers}
+                self.broadcaster = self.broadcasters[self.tiers[0]]
+                self._worker = CaptureWorker(self.cap, self.process, self.broadcasters, self.encoder_pool,
+                                             self.sinks)
+                self._worker.start()
+            return self.broadcaster
+
+    # Also hand every annotated frame to sink while sink.active
+    def attach(self, sink):
+        self.sinks.append(sink)
+
+    # Best tier that is neither wider nor of higher quality than requested,
+    # or the lowest tier when none fits
+    def tier(self, width=None, quality=None):
+        for tier in self.tiers:
+            if ((width is None or (tier.width or float('inf')) <= width)
+                    and (quality is None or (tier.quality or 100) <= quality)):
+                return tier
+        return self.tiers[-1]
+
+    def _backpressure(self, tier, adaptive):
+        if not adaptive or tier == self.tiers[-1]:
+            return None
+        return Backpressure(self.backpressure_window, self.max_skipped)
+
+    def _lower(self, tier):
+        TIER_DOWNGRADES.inc()
+        return self.tiers[self.tiers.index(tier) + 1]
+
+    def subscribe(self, tier=None, adaptive=True):
+        self.ensure_started()
+        return self._subscribe(tier or self.tiers[0], adaptive)
+
+    def _subscribe(self, tier, adaptive):
+        while True:
+            broadcaster = self.broadcasters[tier]
+            backpressure = self._backpressure(tier, adaptive)
+            yield from broadcaster.subscribe(backpressure)
+            if broadcaster.closed or backpressure is None:
+                return
+            tier = self._lower(tier)
+
+    # Async counterpart of subscribe(); call ensure_started() first
+    async def asubscribe(self, tier=None, adaptive=True):
+        tier = tier or self.tiers[0]
+        while True:
+            broadcaster = self.broadcasters[tier]
+            backpressure = self._backpressure(tier, adaptive)
+            async for frame in broadcaster.asubscribe(backpressure):
+                yield frame
+            if broadcaster.closed or backpressure is None:
+                return
+            tier = self._lower(tier)
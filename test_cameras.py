@@ -0,0 +1,40 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from cameras import CameraProcess
+
+
+# Frame processor built in the camera process. Importing Flask there is what
+# updatedUI.frame_processor does, and must not pick up the repo's flask.py.
+# The sleep stands in for inference, so the clip outlasts the first read
+def build_process(camera_id):
+    from flask import Flask
+
+    def process(img):
+        time.sleep(0.01)
+        return img, {'camera': camera_id, 'flask': Flask.__module__}
+    return process
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(30):
+        writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_camera_process_serves_frames(clip):
+    camera = CameraProcess('gate-1', {'source': clip, 'width': 64, 'height': 48, 'process': True}, build_process)
+    try:
+        success, img = camera.read()
+    finally:
+        camera.release()
+    assert success
+    assert img.shape == (48, 64, 3)
+    assert camera.state == {'camera': 'gate-1', 'flask': 'flask.app'}
@@ -0,0 +1,173 @@
+import itertools
+import random
+
+import pytest
+
+from session import IDLE, NO_FACE_TIMEOUT, RESETTING, RESULT, VERIFYING, VerificationSession
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def make_session(clock, **settings):
+    settings.setdefault('decide_score', None)  # Only the fixed threshold unless a test enables it
+    return VerificationSession('test', clock=clock, **settings)
+
+
+# Feed one detection per frame at fps until the session leaves `state` (or
+# `seconds` pass); returns the seconds that took
+def run_while(session, clock, state, fps, detection='real', confidence=0.9, seconds=60):
+    start = clock()
+    while session.state == state and clock() - start < seconds:
+        clock.advance(1 / fps)
+        session.update(detection, confidence=confidence)
+    return clock() - start
+
+
+# Feed (detection, confidence) pairs at fps until a verdict or `seconds`
+# pass; returns (verdict, elapsed seconds, score at the verdict)
+def run_frames(session, clock, frames, fps=30, seconds=30):
+    start = clock()
+    for detection, confidence in frames:
+        if clock() - start >= seconds:
+            break
+        verdict = session.update(detection, confidence=confidence)
+        if verdict:
+            return verdict, clock() - start, session.aggregator.score
+        clock.advance(1 / fps)
+    return None, clock() - start, session.aggregator.score
+
+
+@pytest.mark.parametrize('fps', [8, 30])
+def test_reset_countdown_takes_the_same_time_at_any_frame_rate(fps):
+    clock = FakeClock()
+    session = make_session(clock, reset_countdown_duration=3)
+    session.reset_verification()
+    assert session.is_resetting
+
+    elapsed = run_while(session, clock, RESETTING, fps)
+    assert session.state == IDLE
+    assert 3 <= elapsed < 3 + 1 / fps + 1e-9
+
+
+@pytest.mark.parametrize('fps', [8, 30])
+def test_verification_threshold_is_measured_in_seconds(fps):
+    clock = FakeClock()
+    session = make_session(clock, verification_threshold=10)
+    session.update('real', confidence=0.9)
+    assert session.is_verifying
+
+    elapsed = run_while(session, clock, VERIFYING, fps)
+    assert session.state == RESULT
+    assert session.verification_status == 'SUCCESS'
+    assert 10 <= elapsed < 10 + 1 / fps + 1e-9
+
+
+def test_dropped_frames_do_not_change_the_timing():
+    clock = FakeClock()
+    session = make_session(clock, verification_threshold=10)
+    session.update('real', confidence=0.9)
+    # Long gaps between frames, still shorter than NO_FACE_TIMEOUT
+    elapsed = run_while(session, clock, VERIFYING, 1 / 0.9)
+    assert session.verification_status == 'SUCCESS'
+    assert 10 <= elapsed < 10.9
+
+
+def test_notification_expires_after_its_duration():
+    clock = FakeClock()
+    session = make_session(clock, verification_threshold=1, notification_duration=3)
+    session.update('real', confidence=0.9)
+    run_while(session, clock, VERIFYING, 30)
+    assert session.show_notification
+
+    clock.advance(2.9)
+    session.update(None)
+    assert session.show_notification
+    clock.advance(0.2)
+    session.update(None)
+    assert session.is_resetting
+
+
+def test_no_face_timeout_resets_the_verification():
+    clock = FakeClock()
+    session = make_session(clock)
+    session.update('real', confidence=0.9)
+    clock.advance(NO_FACE_TIMEOUT - 0.5)
+    session.update(None)
+    assert session.is_verifying
+
+    clock.advance(1.0)
+    session.update(None)
+    assert session.is_resetting
+    assert session.verification_status is None
+
+
+def test_reset_request_is_applied_between_frames():
+    clock = FakeClock()
+    session = make_session(clock)
+    session.update('real', confidence=0.9)
+    session.request(reset=True, settings={'verification_threshold': 5})
+    assert session.is_verifying
+
+    session.apply_requests()
+    assert session.is_resetting
+    assert session.verification_threshold == 5
+
+
+def test_alternating_classes_never_pass():
+    clock = FakeClock()
+    session = make_session(clock, decide_score=0.85)
+    frames = itertools.cycle([('real', 0.9), ('fake', 0.9)])
+    verdict, _, score = run_frames(session, clock, frames)
+    assert verdict is None
+    assert abs(score) < session.aggregator.hysteresis
+    assert session.is_verifying
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_mix_never_passes(seed):
+    rng = random.Random(seed)
+    clock = FakeClock()
+    session = make_session(clock, decide_score=0.85)
+    frames = ((rng.choice(['real', 'fake']), 0.9) for _ in itertools.count())
+    verdict, _, _ = run_frames(session, clock, frames, seconds=60)
+    assert verdict != 'SUCCESS'
+
+
+def test_single_flickering_frames_do_not_restart_the_timer():
+    clock = FakeClock()
+    session = make_session(clock, verification_threshold=10)
+    frames = (('fake', 0.9) if i % 30 == 15 else ('real', 0.9) for i in itertools.count())
+    verdict, elapsed, _ = run_frames(session, clock, frames)
+    assert verdict == 'SUCCESS'
+    assert elapsed == pytest.approx(10, abs=0.1)
+
+
+def test_decisive_evidence_gives_an_early_verdict():
+    clock = FakeClock()
+    session = make_session(clock, decide_score=0.85, min_evidence=3)
+    verdict, elapsed, _ = run_frames(session, clock, itertools.repeat(('real', 0.9)))
+    assert verdict == 'SUCCESS'
+    assert elapsed == pytest.approx(3, abs=0.1)
+
+    clock = FakeClock()
+    session = make_session(clock, decide_score=0.85, min_evidence=3)
+    verdict, elapsed, _ = run_frames(session, clock, itertools.repeat(('fake', 0.9)))
+    assert verdict == 'FAILED'
+    assert elapsed == pytest.approx(3, abs=0.1)
+
+
+def test_weak_evidence_waits_for_the_threshold():
+    clock = FakeClock()
+    session = make_session(clock, decide_score=0.85, verification_threshold=10)
+    verdict, elapsed, _ = run_frames(session, clock, itertools.repeat(('real', 0.7)))
+    assert verdict == 'SUCCESS'
+    assert elapsed == pytest.approx(10, abs=0.1)
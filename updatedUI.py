@@ -1,58 +1,127 @@
-import math
+import os
 import time
 import cv2
-import cvzone
-from ultralytics import YOLO
-from flask import Flask, Response, render_template_string
+import overlay
+from backends import LazyModel
+from batching import InferenceScheduler
+from cadence import CadenceTracker
+from cameras import CameraRegistry, load_cameras
+from encoding import EncoderPool, JpegEncoder
+from events import EventBus, format_sse
+from evidence import EvidenceRecorder
+from facecrop import FaceLocator, to_frame
+from h264 import FMP4_MIMETYPE, H264Stream
+from inference_server import RemoteModel
+from metrics import (ACTIVE_SESSIONS, CONTENT_TYPE, FRAMES, REGISTRY, STAGE_SECONDS, STREAM_FPS,
+                     VERIFICATIONS, FpsMeter)
+from postprocess import box_array, extract_detections, to_detections
+from resultcache import ResultCache
+from session import SessionRegistry, parse_settings
+from upload import FrameDecoder, UploadTooLarge
+from flask import Flask, Response, abort, jsonify, request, render_template_string
 
 # Initialize Flask app
 app = Flask(__name__)
 
 # Initialize YOLO model
-model = YOLO("../models/best_190.pt")
+MODEL_BACKEND = "torch"  # torch, onnx, onnx-int8 or openvino (exports are cached next to the weights)
+WARMUP_RUNS = 2  # Dummy frames run through the model before /readyz reports ready
+# Address of an inference_server.py (e.g. "127.0.0.1:6000") shared by several web workers, so the
+# model is loaded once per inference process. None = load the model in this process
+INFERENCE_SERVER = None
+if INFERENCE_SERVER:
+    model = RemoteModel(INFERENCE_SERVER)
+else:
+    # The model is loaded in the background by create_app() or the first request, not at import
+    model = LazyModel("../models/best_190.pt", MODEL_BACKEND, warmup=WARMUP_RUNS)
 confidence = 0.6
 classNames = ["fake", "real"]
 
-# Open camera
-cap = cv2.VideoCapture(1)  # For Webcam
-cap.set(3, 360)  # Width (9 parts)
-cap.set(4, 640)  # Height (16 parts)
-
-# Calculate FPS
-prev_frame_time = 0
-new_frame_time = 0
-
-# Variables for face detection tracking
-face_detection_start = None
-current_detection = None
-verification_status = None
-show_notification = False
-notification_start = None
-is_resetting = False
-reset_countdown = 0
+# Batched inference shared by all active streams
+BATCH_SIZE = 8  # Maximum number of frames per batch
+BATCH_MAX_WAIT = 0.005  # Maximum time to wait for a batch to fill in seconds
+scheduler = InferenceScheduler(model, max_batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT)
+
+# Run the detector every N frames, frames in between reuse the tracked boxes
+INFERENCE_EVERY_N = 3
+INFERENCE_FRAME_BUDGET = None  # Seconds of inference per frame; when set, N adapts to latency
+
+# Two-stage mode: find the face first (last box or Haar cascade) and run the model on the face
+# crop only, skipping it entirely when nobody is in front of the camera
+FACE_ROI = False
+FACE_ROI_SIZE = 320  # Longer side of the face crop in pixels
+face_locator = FaceLocator(FACE_ROI_SIZE) if FACE_ROI else None
+
+# Frames nearly identical to the last inferred frame reuse its detections
+RESULT_CACHE_TOLERANCE = 3.0  # Mean pixel difference (0-255) of 32x32 thumbnails; None = disabled
+RESULT_CACHE_MAX_AGE = 1.0  # Maximum age of reused detections in seconds
+
 RESET_COUNTDOWN_DURATION = 3  # Duration of reset countdown in seconds
 NOTIFICATION_DURATION = 3  # Duration of notification in seconds
 VERIFICATION_THRESHOLD = 10  # Time required for verification in seconds
-detect_start_time = None  # Track when detection started
-verification_timer = 0  # Timer for successful detection
+# Aggregated score (EMA of confidences, 0-1) that gives a verdict before VERIFICATION_THRESHOLD
+# once it holds for EARLY_DECISION_SECONDS; None = always wait VERIFICATION_THRESHOLD
+EARLY_DECISION_SCORE = 0.85
+EARLY_DECISION_SECONDS = 3
+
+# Verification state per session/stream, idle sessions are evicted
+sessions = SessionRegistry(verification_threshold=VERIFICATION_THRESHOLD,
+                           notification_duration=NOTIFICATION_DURATION,
+                           reset_countdown_duration=RESET_COUNTDOWN_DURATION,
+                           decide_score=EARLY_DECISION_SCORE,
+                           min_evidence=EARLY_DECISION_SECONDS,
+                           confidence=confidence)
+CAMERA_SESSION_ID = "camera"
+
+# Cameras from cameras.json (id -> source, width, height, process). Without that file only the
+# local webcam below is used, captured on a thread of the web process
+CAMERAS_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cameras.json")
+DEFAULT_CAMERAS = {CAMERA_SESSION_ID: {"source": 1,  # For Webcam
+                                       "width": 360, "height": 640,  # Width 9 : height 16
+                                       "process": False}}
+cameras = load_cameras(CAMERAS_CONFIG, DEFAULT_CAMERAS)
+
+UPLOAD_MAX_WIDTH = 640  # Wider uploaded frames are decoded at reduced scale
+
+# Structured per-session verification events for SSE clients (/events/<session_id>)
+event_bus = EventBus()
+HEADLESS = False  # True = skip all overlay drawing, results are only sent as events
+
+# Evidence for audits: the frames of the last seconds before every FAILED verdict (and a sample of
+# SUCCESS ones) are kept as small JPEGs (at most 4 MB per session) and written to EVIDENCE_DIR by a
+# background thread, without holding up the frame loop
+EVIDENCE_DIR = None  # Absolute path, e.g. "/var/lib/liveness/evidence"; None = off
+EVIDENCE_PRE_ROLL = 3  # Seconds of frames before the verdict that are kept
+EVIDENCE_SUCCESS_SAMPLE = 0.1  # Fraction of SUCCESS verdicts that are recorded
+EVIDENCE_UPLOADS = False  # True = record client upload sessions too, not only cameras
+evidence_recorder = (EvidenceRecorder(EVIDENCE_DIR, classNames, EVIDENCE_PRE_ROLL,
+                                      success_sample=EVIDENCE_SUCCESS_SAMPLE) if EVIDENCE_DIR else None)
+RENDER_MODE = "rich"  # "rich" or "lite" (plain boxes and text, no gradients or blended banner)
+
+# Metrics for /metrics; FPS is sampled once per second instead of printed every frame
+upload_frames = FRAMES.labels('upload')
+inference_seconds = STAGE_SECONDS.labels('inference')
+drawing_seconds = STAGE_SECONDS.labels('drawing')
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+
+
+# Colors per detection type; the gradient border colors are blended once here
+DETECTION_STYLES = {
+    'real': {'border': (0, 255, 0), 'text': (0, 200, 0),
+             'rings': overlay.gradient_rings((200, 255, 200), (0, 255, 0))},
+    'fake': {'border': (0, 0, 255), 'text': (0, 0, 200),
+             'rings': overlay.gradient_rings((255, 200, 200), (0, 0, 255))},
+}
 
 
 def advanced_detection_visualization(img, x1, y1, x2, y2, conf, detection_type):
     # Select color based on detection type
-    if detection_type == 'real':
-        border_color = (0, 255, 0)
-        text_color = (0, 200, 0)
-        bg_color = (200, 255, 200)
-    else:
-        border_color = (0, 0, 255)
-        text_color = (0, 0, 200)
-        bg_color = (255, 200, 200)
+    style = DETECTION_STYLES['real' if detection_type == 'real' else 'fake']
+    border_color = style['border']
 
     # Gradient border effect
-    for i in range(5):
-        alpha = i / 5.0
-        color = tuple(int(a * (1 - alpha) + b * alpha) for a, b in zip(bg_color, border_color))
-        cv2.rectangle(img, (x1 - i * 2, y1 - i * 2), (x2 + i * 2, y2 + i * 2), color, max(1, 5 - i))
+    for grow, color, thickness in style['rings']:
+        cv2.rectangle(img, (x1 - grow, y1 - grow), (x2 + grow, y2 + grow), color, thickness)
 
     # Confidence bar
     bar_width = x2 - x1
@@ -60,208 +129,392 @@ def advanced_detection_visualization(img, x1, y1, x2, y2, conf, detection_type):
     cv2.rectangle(img, (x1, y2 + 10), (x2, y2 + 20), (200, 200, 200), -1)
     cv2.rectangle(img, (x1, y2 + 10), (x1 + confidence_width, y2 + 20), border_color, -1)
 
-    # Text with shadow
-    cvzone.putTextRect(
-        img,
-        f"{detection_type.upper()} {int(conf * 100)}%",
-        (x1, y1 - 20),
-        scale=1.5,
-        thickness=2,
-        colorR=text_color,
-        colorB=(50, 50, 50),
-        border=2
-    )
-
-
-def reset_verification():
-    global face_detection_start, current_detection, verification_status, show_notification, is_resetting, reset_countdown
-    global detect_start_time, verification_timer
-    face_detection_start = None
-    current_detection = None
-    verification_status = None
-    show_notification = False
-    is_resetting = True
-    reset_countdown = RESET_COUNTDOWN_DURATION
-    detect_start_time = None
-    verification_timer = 0
-
-
-def start_new_verification():
-    global is_resetting, reset_countdown
-    is_resetting = False
-    reset_countdown = 0
+    # Text with shadow, pre-rendered once per label
+    overlay.text_rect(f"{detection_type.upper()} {int(conf * 100)}%", scale=1.5, thickness=2,
+                      colorR=style['text'], colorB=(50, 50, 50), border=2).paste(img, (x1, y1 - 20))
+
+
+# Cheap detection drawing for RENDER_MODE = "lite"
+def lite_detection_visualization(img, x1, y1, x2, y2, conf, detection_type):
+    color = DETECTION_STYLES['real' if detection_type == 'real' else 'fake']['border']
+    cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+    cv2.putText(img, f"{detection_type.upper()} {int(conf * 100)}%", (x1, max(15, y1 - 8)),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+
+# Detect faces with YOLO, or carry the last boxes forward on skipped frames.
+# Returns a list of (x1, y1, x2, y2, conf, cls) above the confidence threshold
+def detect_faces(img, session):
+    if session.cadence is None:
+        session.cadence = CadenceTracker(INFERENCE_EVERY_N, INFERENCE_FRAME_BUDGET)
+    if not session.cadence.should_infer():
+        return session.cadence.predict()
+
+    thumb = None
+    if RESULT_CACHE_TOLERANCE is not None:
+        if session.result_cache is None:
+            session.result_cache = ResultCache(RESULT_CACHE_TOLERANCE, RESULT_CACHE_MAX_AGE)
+        thumb = session.result_cache.fingerprint(img)
+        detections = session.result_cache.lookup(thumb)
+        if detections is not None:
+            session.cadence.update(detections)  # Nearly identical frame, the model is not run
+            return detections
+
+    start = time.perf_counter()
+    if face_locator is None:
+        detections = extract_detections(scheduler.infer(img, session.session_id), session.confidence)
+    else:
+        detections = detect_in_face_roi(img, session)
+    latency = time.perf_counter() - start
+    inference_seconds.observe(latency)
+    session.cadence.update(detections, latency)
+    if thumb is not None:
+        session.result_cache.store(thumb, detections)
+    return detections
+
+
+# Two-stage mode: run the model on the face crop only, no inference when there is no face
+def detect_in_face_roi(img, session):
+    box = face_locator.locate(img, session.cadence.predict())
+    if box is None:
+        return []
+    crop, transform = face_locator.crop(img, box)
+    dets = box_array(scheduler.infer(crop, session.session_id), session.confidence)
+    return to_detections(to_frame(dets, transform))
+
+
+# Draw the countdown shown before a new scan starts
+def draw_reset_countdown(img, session):
+    if session.reset_countdown > 0:
+        overlay.text_rect(f"Starting new scan in: {int(session.reset_countdown)}s",
+                          scale=2, thickness=2, colorR=(255, 165, 0)).paste(
+            img, (int(img.shape[1] / 2) - 150, int(img.shape[0] / 2)))
+        overlay.text_rect("Please position your face", scale=1, thickness=1).paste(
+            img, (int(img.shape[1] / 2) - 120, int(img.shape[0] / 2) + 40))
+
+
+# Draw the detection boxes, verification countdown and result notification
+def draw_overlay(img, session, detections, current_frame_detection):
+    visualize = lite_detection_visualization if RENDER_MODE == "lite" else advanced_detection_visualization
+    for x1, y1, x2, y2, conf, cls in detections:
+        visualize(img, x1, y1, x2, y2, conf, classNames[cls])
+
+    if session.is_verifying:
+        if current_frame_detection:
+            # Display countdown timer for detection
+            cv2.putText(img, f"Timer: {int(session.verification_timer)}s",
+                        (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+
+            # Draw the countdown circle
+            circle_center = (img.shape[1] - 100, 100)
+            circle_radius = 40
+            cv2.circle(img, circle_center, circle_radius, (200, 200, 200), 10)
+            angle = (session.verification_timer / session.verification_threshold) * 360
+            cv2.ellipse(img, circle_center, (circle_radius, circle_radius), -90, 0, angle, (0, 255, 0), 10)
+        else:
+            # Reset if no face detected
+            overlay.text_rect("No face detected! Please position your face.", scale=1, thickness=1).paste(
+                img, (10, img.shape[0] - 20))
+
+    # Show verification result notification
+    if session.show_notification:
+        # Successful verification
+        if session.verification_status == "SUCCESS":
+            banner_color = (50, 200, 50)
+            status_text = "VERIFICATION SUCCESSFUL"
+            status_color = (0, 255, 0)
+        else:
+            # Failed verification
+            banner_color = (50, 50, 200)
+            status_text = "VERIFICATION FAILED"
+            status_color = (0, 0, 255)
+
+        # Transparency overlay, blended over the banner rows only
+        if RENDER_MODE != "lite":
+            alpha = 0.6
+            overlay.blend_band(img, img.shape[0] // 2 - 100, img.shape[0] // 2 + 101, banner_color, alpha)
+
+        # Status text with shadow effect
+        overlay.shadowed_text(status_text, 1.5, status_color, 3, shadow=(0, 0, 0), shadow_thickness=5).paste(
+            img, (img.shape[1] // 2 - 250, img.shape[0] // 2))
+
+
+# Reset, detection and verification logic for one frame, without drawing.
+# Returns (detections, current_frame_detection), or None during the reset countdown
+def update_session(img, session):
+    # Handle reset countdown
+    if session.is_resetting:
+        session.tick_reset()
+        event_bus.publish_state(session)
+        return None
+
+    detections = detect_faces(img, session)
+    current_frame_detection = classNames[detections[-1][5]] if detections else None
+
+    # Face verification logic
+    confidence = detections[-1][4] if detections else None
+    if session.evidence is not None:
+        session.evidence.add(img, detections)  # Before the overlay is drawn
+    result = session.update(current_frame_detection, confidence=confidence)
+    if result:
+        VERIFICATIONS.labels(result).inc()
+        if session.evidence is not None:
+            evidence_recorder.submit(session.session_id, result, session.evidence, session.to_dict())
+    event_bus.publish_state(session, confidence)
+    return detections, current_frame_detection
+
+
+# Process one frame: reset logic, detection, verification and overlay
+def annotate_frame(img, session):
+    session.apply_requests()  # Reset/settings from HTTP are applied between frames
+    if session.is_resetting:
+        if not HEADLESS:
+            start = time.perf_counter()
+            draw_reset_countdown(img, session)
+            drawing_seconds.observe(time.perf_counter() - start)
+        update_session(img, session)
+        return
+
+    detections, current_frame_detection = update_session(img, session)
+    if not HEADLESS:
+        start = time.perf_counter()
+        draw_overlay(img, session, detections, current_frame_detection)
+        drawing_seconds.observe(time.perf_counter() - start)
+
+
+# Frame processing function for one camera, the result is encoded by the encoder pool.
+# In a camera process (with_state=True) the verification state is returned as well
+def frame_processor(camera_id, with_state=False):
+    fps_meter = FpsMeter(STREAM_FPS.labels(camera_id))
+    camera_frames = FRAMES.labels(camera_id)
+
+    def process_frame(img):
+        session = sessions.get(camera_id)
+        if evidence_recorder is not None and session.evidence is None:
+            session.evidence = evidence_recorder.buffer()
+        annotate_frame(img, session)
+        camera_frames.inc()
+        fps_meter.tick()
+        return (img, session.to_dict()) if with_state else img
+
+    return process_frame
+
+
+# Command (reset, settings) for a session in this process; also called in camera processes for
+# commands from the web process. Applied by the frame loop between two frames
+def control_session(session_id, command):
+    reset, settings = command
+    sessions.get(session_id).request(reset, settings)
+
+
+# True when session_id is an existing session or a camera from cameras.json
+def known_session(session_id):
+    return sessions.find(session_id) is not None or camera_registry.hub(session_id) is not None
+
+
+# Send a command to the camera process that owns the session, or to the local session
+def send_command(session_id, reset=False, settings=None):
+    command = (reset, settings or {})
+    if not camera_registry.send(session_id, command):
+        control_session(session_id, command)
+
+
+# Verify one frame sent by a client (no server camera). Uploads arrive at the client's pace
+# (maybe ~1 fps), so every frame is inferred instead of every INFERENCE_EVERY_N
+def verify_frame(img, session):
+    if session.cadence is None:
+        session.cadence = CadenceTracker(1)
+    if EVIDENCE_UPLOADS and evidence_recorder is not None and session.evidence is None:
+        session.evidence = evidence_recorder.buffer()
+    session.apply_requests()
+    state = update_session(img, session)
+    upload_frames.inc()
+    detections = state[0] if state else []
+    return dict(session.to_dict(), frame_size=[img.shape[1], img.shape[0]],
+                detections=[{'box': [x1, y1, x2, y2], 'confidence': conf, 'class': classNames[cls]}
+                            for x1, y1, x2, y2, conf, cls in detections])
+
+
+# JPEG encoding on its own thread pool, once per frame for all clients
+JPEG_QUALITY = 95  # JPEG quality (0-100), lower = less bandwidth
+ENCODER_WORKERS = 2  # Number of encoder threads
+# (width, quality) tiers for /video?w=240&q=60, best first. Each tier is resized and encoded once
+# per frame for all of its clients; width None = the frame's own size
+STREAM_TIERS = [(None, JPEG_QUALITY), (360, 80), (240, 60), (160, 40)]
+ADAPTIVE_TIERS = True  # True = clients that fall behind move down to a lower tier
+
+# One capture + inference loop per camera (thread or own process) shared by every /video client
+camera_registry = CameraRegistry(cameras, frame_processor,
+                                 lambda: EncoderPool(JpegEncoder(JPEG_QUALITY), ENCODER_WORKERS),
+                                 event_bus.publish_snapshot, STREAM_TIERS, control_session)
+stream_hub = camera_registry.hub()  # Default camera for /video
+encoder_pool = stream_hub.encoder_pool
+
+# Optional H.264 stream mode (fragmented MP4 for <video>) at /video.mp4, a fraction of the MJPEG
+# bandwidth for a mostly static face. Needs ffmpeg with libx264 on the PATH
+H264_STREAM = False
+H264_FPS = 15  # Encoded frames per second, the last frame is repeated when inference is slower
+H264_BITRATE = "500k"
+h264_streams = {}
+if H264_STREAM:
+    for camera_id in camera_registry:
+        h264_streams[camera_id] = H264Stream(H264_FPS, H264_BITRATE)
+        camera_registry.hub(camera_id).attach(h264_streams[camera_id])
 
 
 # Function to handle video stream
-def generate_frames():
-    global prev_frame_time, face_detection_start, current_detection, verification_status
-    global show_notification, notification_start, is_resetting, reset_countdown
-    global detect_start_time, verification_timer
-
-    while True:
-        new_frame_time = time.time()
-        success, img = cap.read()
-
-        if not success:
-            break
-
-        # Handle reset countdown
-        if is_resetting:
-            if reset_countdown > 0:
-                cvzone.putTextRect(
-                    img,
-                    f"Starting new scan in: {int(reset_countdown)}s",
-                    (int(img.shape[1] / 2) - 150, int(img.shape[0] / 2)),
-                    scale=2, thickness=2, colorR=(255, 165, 0)
-                )
-                cvzone.putTextRect(
-                    img,
-                    "Please position your face",
-                    (int(img.shape[1] / 2) - 120, int(img.shape[0] / 2) + 40),
-                    scale=1, thickness=1
-                )
-                reset_countdown -= 1 / 30  # Assuming 30 FPS
-            else:
-                start_new_verification()
-
-            # Convert frame to JPEG during reset countdown
-            ret, buffer = cv2.imencode('.jpg', img)
-            if not ret:
-                break
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'  
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-            continue
-
-        results = model(img, stream=True, verbose=False)
-        current_frame_detection = None
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                # Bounding Box
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                cls = int(box.cls[0])
-
-                if conf > confidence:
-                    current_frame_detection = classNames[cls]
-
-                    # Use advanced visualization function
-                    advanced_detection_visualization(img, x1, y1, x2, y2, conf, classNames[cls])
-
-        # Face verification logic
-        if current_frame_detection:
-            if current_detection != current_frame_detection:  # Detection type has changed
-                current_detection = current_frame_detection
-                detect_start_time = time.time()  # Start the timer for current detection
-                verification_timer = 0  # Reset timer
-            else:
-                if detect_start_time is not None:  # Timer is running
-                    elapsed_time = time.time() - detect_start_time
-                    verification_timer = elapsed_time  # Update verification timer
-
-                    # Display countdown timer for detection
-                    cv2.putText(img, f"Timer: {int(verification_timer)}s",
-                                (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-
-                    # Draw the countdown circle
-                    circle_center = (img.shape[1] - 100, 100)
-                    circle_radius = 40
-                    cv2.circle(img, circle_center, circle_radius, (200, 200, 200), 10)
-                    angle = (verification_timer / VERIFICATION_THRESHOLD) * 360
-                    cv2.ellipse(img, circle_center, (circle_radius, circle_radius), -90, 0, angle, (0, 255, 0), 10)
-
-                    # Check if verification threshold met
-                    if verification_timer >= VERIFICATION_THRESHOLD:
-                        verification_status = "SUCCESS" if current_detection == "real" else "FAILED"
-                        show_notification = True
-                        notification_start = time.time()
-        else:
-            if face_detection_start and not verification_status:
-                # Reset if no face detected
-                cvzone.putTextRect(img, "No face detected! Please position your face.",
-                                   (10, img.shape[0] - 20), scale=1, thickness=1)
-                if time.time() - face_detection_start > 2:  # Reset after 2 seconds of no detection
-                    reset_verification()
-
-        # Show verification result notification
-        if show_notification:
-            notification_elapsed = time.time() - notification_start
-            if notification_elapsed < NOTIFICATION_DURATION:
-                overlay = img.copy()
-
-                # Successful verification
-                if verification_status == "SUCCESS":
-                    cv2.rectangle(overlay, (0, img.shape[0] // 2 - 100),
-                                  (img.shape[1], img.shape[0] // 2 + 100),
-                                  (50, 200, 50), -1)
-                    status_text = "VERIFICATION SUCCESSFUL"
-                    status_color = (0, 255, 0)
-                else:
-                    # Failed verification
-                    cv2.rectangle(overlay, (0, img.shape[0] // 2 - 100),
-                                  (img.shape[1], img.shape[0] // 2 + 100),
-                                  (50, 50, 200), -1)
-                    status_text = "VERIFICATION FAILED"
-                    status_color = (0, 0, 255)
-
-                # Transparency overlay
-                alpha = 0.6
-                cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, img)
-
-                # Status text with shadow effect
-                cv2.putText(img, status_text,
-                            (img.shape[1] // 2 - 250, img.shape[0] // 2),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            1.5, (0, 0, 0), 5)  # Shadow
-                cv2.putText(img, status_text,
-                            (img.shape[1] // 2 - 250, img.shape[0] // 2),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            1.5, status_color, 3)
-
-                # Reset button
-                reset_button = (img.shape[1] // 2 - 100, img.shape[0] // 2 + 100,
-                                img.shape[1] // 2 + 100, img.shape[0] // 2 + 150)
-                cv2.rectangle(img, (reset_button[0], reset_button[1]),
-                              (reset_button[2], reset_button[3]),
-                              (150, 150, 150), -1)
-                cv2.putText(img, "RESET",
-                            (reset_button[0] + 50, reset_button[1] + 40),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            1, (0, 0, 0), 2)
-
-        # Calculate FPS
-        fps = 1 / (new_frame_time - prev_frame_time)
-        prev_frame_time = new_frame_time
-        print(f"FPS: {fps}")
-
-        # Handle keyboard input
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('r') or key == ord('R'):
-            reset_verification()
-
-        # Convert frame to JPEG
-        ret, buffer = cv2.imencode('.jpg', img)
-        if not ret:
-            break
-        frame = buffer.tobytes()
-
-        yield (b'--frame\r\n'  
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-
-# Route to display video stream
+def generate_frames(camera_id=None, width=None, quality=None):
+    hub = camera_registry.hub(camera_id)
+    return hub.subscribe(hub.tier(width, quality), ADAPTIVE_TIERS)
+
+
+# Verification state of a local session or of a camera in another process, None if unknown
+def find_state(session_id):
+    session = sessions.find(session_id)
+    if session is not None:
+        return session.to_dict()
+    return camera_registry.state(session_id)
+
+
+# Route to display video stream, ?w=<width>&q=<quality> picks a tier
 @app.route('/video')
 def video():
-    return Response(generate_frames(),
+    return Response(generate_frames(None, request.args.get('w', type=int),
+                                    request.args.get('q', type=int)),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
-# Route for the main page displaying video stream in HTML
-@app.route('/')
-def index():
-    return render_template_string('''  
+# Route to display the video stream of one camera from cameras.json
+@app.route('/video/<camera_id>')
+def camera_video(camera_id):
+    if camera_registry.hub(camera_id) is None:
+        abort(404)
+    return Response(generate_frames(camera_id, request.args.get('w', type=int),
+                                    request.args.get('q', type=int)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+# Route to the H.264 (fragmented MP4) stream for <video>, only when H264_STREAM is on
+@app.route('/video.mp4')
+@app.route('/video.mp4/<camera_id>')
+def video_mp4(camera_id=None):
+    camera_id = camera_id or camera_registry.default
+    stream = h264_streams.get(camera_id)
+    if stream is None:
+        abort(404)
+    camera_registry.hub(camera_id).ensure_started()
+    return Response(stream.subscribe(), mimetype=FMP4_MIMETYPE, headers={'Cache-Control': 'no-cache'})
+
+
+# Server-Sent Events route with the verification results of one session
+@app.route('/events/<session_id>')
+def verification_events(session_id):
+    def stream():
+        subscription = event_bus.subscribe(session_id)
+        try:
+            state = find_state(session_id)
+            if state is not None:
+                yield format_sse(dict(state, type='state'))
+            while True:
+                events = subscription.get(timeout=15)
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(session_id, subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# Route to verify a JPEG frame sent by a client (request body = one frame)
+@app.route('/verify/<session_id>/frame', methods=['POST'])
+def verify_uploaded_frame(session_id):
+    session = sessions.get(session_id)
+    # Concurrent requests for the same session share the decoder buffer and the verification state
+    with session.lock:
+        if session.decoder is None:
+            session.decoder = FrameDecoder(UPLOAD_MAX_WIDTH)
+        try:
+            data = session.decoder.read(request.stream, request.content_length or 0)
+        except UploadTooLarge:
+            abort(413)
+        img = session.decoder.decode(data)
+        if img is None:
+            abort(400)
+        result = verify_frame(img, session)
+    return jsonify(result)
+
+
+# Route for the verification state of one session as JSON
+@app.route('/verification/<session_id>')
+def verification_state(session_id):
+    state = find_state(session_id)
+    if state is None:
+        abort(404)
+    return jsonify(state)
+
+
+# Route to start a new scan for one session or camera (replaces the 'R' key)
+@app.route('/verification/<session_id>/reset', methods=['POST'])
+def reset_verification(session_id):
+    if not known_session(session_id):
+        abort(404)
+    send_command(session_id, reset=True)
+    return jsonify({'status': 'queued'}), 202
+
+
+# Route to read or change confidence, verification_threshold, notification_duration and
+# reset_countdown_duration of one session at runtime, without a restart
+@app.route('/verification/<session_id>/config', methods=['GET', 'POST'])
+def verification_config(session_id):
+    if request.method == 'POST':
+        if not known_session(session_id):
+            abort(404)
+        try:
+            settings = parse_settings(request.get_json(silent=True))
+        except ValueError as e:
+            abort(400, str(e))
+        send_command(session_id, settings=settings)
+        return jsonify({'status': 'queued', 'settings': settings}), 202
+    state = find_state(session_id)
+    if state is None:
+        abort(404)
+    return jsonify(state['settings'])
+
+
+# Route for batched inference latency/throughput stats
+@app.route('/inference/stats')
+def inference_stats():
+    return jsonify(scheduler.stats())
+
+
+# Liveness route: the process is up and answering requests
+@app.route('/healthz')
+def healthz():
+    return jsonify(status='ok')
+
+
+# Readiness route: 503 until the model is loaded and warmed up
+@app.route('/readyz')
+def readyz():
+    model.start()
+    if model.ready:
+        return jsonify(status='ready')
+    if model.error is not None:
+        return jsonify(status='error', error=str(model.error)), 503
+    return jsonify(status='loading'), 503
+
+
+# Route for Prometheus metrics (FPS, per-stage latency, dropped frames, verification results)
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+# Main page markup (a template for the id of the camera shown by /video), shared with the ASGI entry point
+INDEX_HTML = '''  
     <html lang="en">  
     <head>  
         <meta charset="UTF-8">  
@@ -341,6 +594,7 @@ def index():
             }  
 
             .status-overlay {  
+                display: none;  
                 position: absolute;  
                 bottom: 0;  
                 left: 0;  
@@ -374,6 +628,18 @@ def index():
                 z-index: 10;  
             }  
 
+            .reset-button {  
+                display: block;  
+                margin: 8px auto 0;  
+                padding: 6px 16px;  
+                border: none;  
+                border-radius: 5px;  
+                background-color: var(--primary-color);  
+                color: white;  
+                font-size: 12px;  
+                cursor: pointer;  
+            }  
+
             /* Animated countdown */  
             .countdown {  
                 position: absolute;  
@@ -424,7 +690,8 @@ def index():
             </div>  
 
             <div class="video-container">  
-                <img src="/video" alt="Face Detection Stream" class="video-stream">  
+                <img src="/video?w=360" alt="Face Detection Stream" class="video-stream">  
+                <div id="countdown" class="countdown" style="display: none;"></div>  
 
                 <div id="successOverlay" class="status-overlay status-success">  
                     Verification Successful  
@@ -436,6 +703,7 @@ def index():
 
             <div class="instructions">  
                 Keep your face steady and within the frame for verification  
+                <button id="resetButton" class="reset-button" type="button">Scan again</button>  
             </div>  
         </div>  
 
@@ -444,6 +712,8 @@ def index():
                 const successOverlay = document.getElementById('successOverlay');  
                 const dangerOverlay = document.getElementById('dangerOverlay');  
                 const countdownElement = document.getElementById('countdown');  
+                const resetButton = document.getElementById('resetButton');  
+                const cameraId = encodeURIComponent({{ camera_id|tojson }});  
 
                 // Function to update the countdown on the UI  
                 function updateCountdown(seconds) {  
@@ -470,16 +740,52 @@ def index():
                     }, 3000);  
                 }  
 
-                // Sample usage for debugging  
-                // You can call showStatus('success') or showStatus('danger')  
-                // based on the verification result from the server  
+                // Verification events pushed by the server for the default camera's session  
+                const events = new EventSource(`/events/${cameraId}`);  
+                events.addEventListener('progress', (e) => {  
+                    const state = JSON.parse(e.data);  
+                    countdownElement.style.display = state.countdown === null ? 'none' : 'block';  
+                    if (state.countdown !== null) {  
+                        updateCountdown(state.countdown);  
+                    }  
+                });  
+                events.addEventListener('result', (e) => {  
+                    const state = JSON.parse(e.data);  
+                    countdownElement.style.display = 'none';  
+                    showStatus(state.verification_status === 'SUCCESS' ? 'success' : 'danger');  
+                });  
+                events.addEventListener('reset', () => {  
+                    countdownElement.style.display = 'none';  
+                });  
+
+                // Start a new scan on the default camera's session  
+                resetButton.addEventListener('click', () => {  
+                    fetch(`/verification/${cameraId}/reset`, { method: 'POST' });  
+                });  
             });  
         </script>  
     </body>  
     </html>  
-    ''')
+    '''
+
+
+# Main page for the default camera; needs an app context, which the ASGI entry point sets up
+def render_index():
+    return render_template_string(INDEX_HTML, camera_id=camera_registry.default)
+
+
+# Route for the main page displaying video stream in HTML
+@app.route('/')
+def index():
+    return render_index()
+
+
+# Application factory for WSGI servers: starts loading and warming up the model in the background
+def create_app():
+    model.start()
+    return app
 
 
 # Run the Flask app
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+MAX_UPLOAD_BYTES = 2 * 1024 * 1024  # Largest accepted JPEG frame
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+# Read the image width from the JPEG SOF header without decoding, None if not found
+def jpeg_width(data):
+    i, n = 2, len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return (data[i + 7] << 8) | data[i + 8]
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+# Per-session decoder for client-uploaded JPEG frames. The request body is
+# read into one growing bytearray that is reused for every frame of the
+# session, and decoded from a zero-copy NumPy view of it. Frames wider than
+# max_width are decoded at reduced scale straight from the JPEG DCT. The
+# buffer is not thread-safe: hold the session's lock while using it.
+class FrameDecoder:
+    __slots__ = ('max_width', '_buffer')
+
+    def __init__(self, max_width=None):
+        self.max_width = max_width
+        self._buffer = bytearray(64 * 1024)
+
+    # Read length bytes from a file-like stream into the reused buffer
+    def read(self, stream, length):
+        if length > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Frame of {length} bytes exceeds {MAX_UPLOAD_BYTES}")
+        if length > len(self._buffer):
+            self._buffer = bytearray(length)
+        view = memoryview(self._buffer)
+        received = 0
+        while received < length:
+            n = stream.readinto(view[received:length])
+            if not n:
+                break
+            received += n
+        return view[:received]
+
+    # Same for a body that arrives as an iterable of chunks (e.g. ASGI), whose
+    # length may be unknown (0); the buffer grows as needed
+    def read_chunks(self, chunks, length=0):
+        if length > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(f"Frame of {length} bytes exceeds {MAX_UPLOAD_BYTES}")
+        if length > len(self._buffer):
+            self._buffer = bytearray(length)
+        received = 0
+        for chunk in chunks:
+            end = received + len(chunk)
+            if end > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge(f"Frame exceeds {MAX_UPLOAD_BYTES} bytes")
+            if end > len(self._buffer):
+                buffer = bytearray(min(MAX_UPLOAD_BYTES, max(end, 2 * len(self._buffer))))
+                buffer[:received] = self._buffer[:received]
+                self._buffer = buffer
+            self._buffer[received:end] = chunk
+            received = end
+        return memoryview(self._buffer)[:received]
+
+    # Returns the BGR image, or None if the data is not a decodable image
+    def decode(self, data):
+        if not len(data):
+            return None
+        buf = np.frombuffer(data, dtype=np.uint8)
+        flags = cv2.IMREAD_COLOR
+        width = jpeg_width(data) if self.max_width else None
+        if width is not None:
+            if width >= self.max_width * 4:
+                flags = cv2.IMREAD_REDUCED_COLOR_4
+            elif width >= self.max_width * 2:
+                flags = cv2.IMREAD_REDUCED_COLOR_2
+        return cv2.imdecode(buf, flags)
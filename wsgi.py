@@ -0,0 +1,8 @@
+# WSGI entry point for the updatedUI.py pipeline, e.g. with several web workers:
+#   gunicorn -w 4 --threads 8 wsgi:app
+# Run from this directory, the repo's flask.py would shadow the installed
+# Flask, so that is imported first (see installed_flask.py).
+import installed_flask  # noqa: F401
+import updatedUI
+
+app = updatedUI.create_app()